@@ -0,0 +1,57 @@
+import asyncio
+import statistics
+import time
+
+from pythonpy.aio import main_async
+
+
+class NullWriter:
+    def write(self, data):
+        pass
+
+    async def drain(self):
+        pass
+
+
+def reader_for(code):
+    reader = asyncio.StreamReader()
+    reader.feed_data(code.encode())
+    reader.feed_eof()
+    return reader
+
+
+async def scenario(yield_every, long_lines=100_000, short_programs=50):
+    long_code = "\n".join(["x = 1"] + ["x = x * 3 / 3 + 1"] * long_lines)
+    short_code = "a = 2\nprint(a * 21)"
+    latencies = []
+
+    async def short_requests():
+        # Latency counts from when a request is due, so time spent waiting
+        # for the event loop behind the long program is included.
+        for _ in range(short_programs):
+            due = time.perf_counter() + 0.001
+            await asyncio.sleep(0.001)
+            await main_async(reader_for(short_code), NullWriter(),
+                             yield_every=yield_every)
+            latencies.append(time.perf_counter() - due)
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        short_requests(),
+        main_async(reader_for(long_code), NullWriter(),
+                   yield_every=yield_every),
+    )
+    total = time.perf_counter() - start
+    return latencies, total
+
+
+def main():
+    for yield_every in (10**9, 1000, 100, 10):
+        latencies, total = asyncio.run(scenario(yield_every))
+        print(f"yield_every={yield_every:>10}: short p50 "
+              f"{statistics.median(latencies) * 1000:7.2f} ms, max "
+              f"{max(latencies) * 1000:7.2f} ms, total {total:5.2f}s")
+
+
+if __name__ == "__main__":
+    main()
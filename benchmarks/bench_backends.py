@@ -0,0 +1,76 @@
+import io
+import time
+
+from benchmarks.generators import arithmetic_program
+from pythonpy import compiler, vm
+from pythonpy.compiler import compile_program
+from pythonpy.evaluator import evaluate
+from pythonpy.lexer import tokenize_program
+from pythonpy.main import main as run_program
+from pythonpy.parser import parse_program
+from pythonpy.vm import compile_bytecode, run
+
+
+def best_of(func, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    code = arithmetic_program(200, 40)
+    program = parse_program(tokenize_program(code))
+
+    def run_tree():
+        fout = io.StringIO()
+        evaluate(program, {}, fout)
+        return fout.getvalue()
+
+    compiled = compile_program(program)
+
+    def run_compiled():
+        fout = io.StringIO()
+        compiled({}, fout)
+        return fout.getvalue()
+
+    bytecode = compile_bytecode(program)
+
+    def run_vm():
+        fout = io.StringIO()
+        run(bytecode, {}, fout)
+        return fout.getvalue()
+
+    assert run_tree() == run_compiled() == run_vm()
+
+    tree = best_of(run_tree)
+    print(f"run only: tree-walker {tree * 1000:.2f} ms, "
+          f"compiled {best_of(run_compiled) * 1000:.2f} ms, "
+          f"vm {best_of(run_vm) * 1000:.2f} ms")
+
+    # main() also lexes, parses and compiles. A program's first run pays
+    # for compiling it; a later run of the same program reuses the code
+    # compiled for the first.
+    def end_to_end(backend):
+        run_program(io.StringIO(code), io.StringIO(), backend=backend)
+
+    def first_run(backend):
+        compiler._programs.clear()
+        compiler._compile_source.cache_clear()
+        vm._programs.clear()
+        end_to_end(backend)
+
+    tree = best_of(lambda: end_to_end("tree"))
+    print(f"main(): tree-walker {tree * 1000:.2f} ms")
+    for backend in ("compiled", "vm"):
+        first = best_of(lambda: first_run(backend))
+        again = best_of(lambda: end_to_end(backend))
+        print(f"main(): {backend:<11} {first * 1000:.2f} ms first run "
+              f"({tree / first:.2f}x), {again * 1000:.2f} ms again "
+              f"({tree / again:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import os
+import sys
+import time
+
+from benchmarks.generators import variable_program
+from pythonpy.batch import run_batch, run_program
+
+
+def main(programs=2000, max_workers=None):
+    max_workers = max_workers or os.cpu_count() or 1
+    sources = [variable_program(10, 50 + i % 50) for i in range(programs)]
+
+    start = time.perf_counter()
+    expected = [run_program(source) for source in sources]
+    serial = time.perf_counter() - start
+    print(f"in-process: {serial:6.2f}s")
+
+    workers = 1
+    while workers <= max_workers:
+        start = time.perf_counter()
+        results = run_batch(sources, max_workers=workers)
+        elapsed = time.perf_counter() - start
+        assert results == expected
+        print(f"{workers:3} workers: {elapsed:6.2f}s  "
+              f"{serial / elapsed:5.2f}x vs in-process")
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main(max_workers=int(sys.argv[1]) if len(sys.argv) > 1 else None)
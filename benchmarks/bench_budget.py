@@ -0,0 +1,39 @@
+import io
+import time
+
+from benchmarks.generators import variable_program
+from pythonpy.budget import Budget
+from pythonpy.evaluator import evaluate
+from pythonpy.lexer import tokenize_program
+from pythonpy.parser import parse_program
+
+
+def best_of(function, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(variables=100, lines=20_000):
+    program = parse_program(tokenize_program(variable_program(variables,
+                                                              lines)))
+    runs = [
+        ("no budget", evaluate),
+        ("per statement", Budget(max_statements=10**9,
+                                 max_variables=10**6).evaluate),
+        ("all limits", Budget(max_statements=10**9, max_time=3600,
+                              max_bits=10**6,
+                              max_variables=10**6).evaluate),
+    ]
+    baseline = None
+    for label, execute in runs:
+        elapsed = best_of(lambda: execute(program, {}, io.StringIO()))
+        baseline = baseline or elapsed
+        print(f"{label:14} {elapsed * 1000:8.1f} ms  {elapsed / baseline:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
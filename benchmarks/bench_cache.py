@@ -0,0 +1,23 @@
+import io
+import tempfile
+import time
+
+from benchmarks.generators import variable_program
+from pythonpy.cache import ProgramCache
+from pythonpy.main import main as run_program
+
+
+def main(lines=20_000, runs=5):
+    code = variable_program(50, lines)
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ProgramCache(directory)
+        for run in range(runs):
+            start = time.perf_counter()
+            run_program(io.StringIO(code), io.StringIO(), cache=cache)
+            elapsed = time.perf_counter() - start
+            print(f"run {run}: {elapsed * 1000:8.1f} ms")
+        print(cache.stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import io
+import time
+
+from benchmarks.generators import repeated_subexpressions
+from pythonpy.cse import NodeInterner, SharedEvaluator
+from pythonpy.evaluator import evaluate
+from pythonpy.lexer import tokenize_program
+from pythonpy.nodes import AssignNode, BinOpNode, NameNode
+from pythonpy.parser import parse_program
+
+
+def count_nodes(program):
+    # Distinct node objects reachable from the program.
+    seen = set()
+    stack = [
+        s.expr if isinstance(s, AssignNode) else s.value
+        for s in program.statements
+    ]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, (BinOpNode, NameNode)) or id(node) in seen:
+            continue
+        seen.add(id(node))
+        if isinstance(node, BinOpNode):
+            stack.append(node.left)
+            stack.append(node.right)
+    return len(seen)
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def main(lines=20_000, repeats=12):
+    token_lines = tokenize_program(repeated_subexpressions(lines, repeats))
+    plain = parse_program(token_lines)
+    interner = NodeInterner()
+    shared = parse_program(token_lines, interner)
+    print(f"nodes: {count_nodes(plain)} plain, {count_nodes(shared)} shared")
+
+    elapsed = timed(lambda: evaluate(plain, {}, io.StringIO()))
+    print(f"tree evaluate    {elapsed * 1000:8.1f} ms")
+    evaluator = SharedEvaluator()
+    elapsed = timed(lambda: evaluator.evaluate(shared, {}, io.StringIO()))
+    print(f"shared evaluate  {elapsed * 1000:8.1f} ms  "
+          f"({evaluator.computed} computed, {evaluator.hits} reused)")
+
+
+if __name__ == "__main__":
+    main()
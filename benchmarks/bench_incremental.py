@@ -0,0 +1,40 @@
+import io
+import time
+
+from benchmarks.generators import variable_program
+from pythonpy.incremental import IncrementalSession
+from pythonpy.main import main as run
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def main(variables=100, lines=20_000):
+    lines_ = variable_program(variables, lines).splitlines()
+    edits = [
+        ("first line", 0),
+        ("middle", len(lines_) // 2),
+        ("last line", len(lines_) - 2),
+    ]
+    code = "\n".join(lines_)
+    session = IncrementalSession()
+    elapsed = timed(lambda: run(io.StringIO(code), io.StringIO()))
+    print(f"full run          {elapsed * 1000:8.1f} ms")
+    elapsed = timed(lambda: session.run(code, io.StringIO()))
+    print(f"first session run {elapsed * 1000:8.1f} ms")
+
+    for label, index in edits:
+        edited = list(lines_)
+        edited[index] = edited[index] + " + 1"
+        code = "\n".join(edited)
+        elapsed = timed(lambda: session.run(code, io.StringIO()))
+        print(f"edit {label:12} {elapsed * 1000:8.1f} ms  "
+              f"parsed {session.parsed}, executed {session.executed}, "
+              f"reused {session.reused}")
+
+
+if __name__ == "__main__":
+    main()
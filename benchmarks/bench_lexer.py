@@ -0,0 +1,119 @@
+import time
+from dataclasses import dataclass
+
+from benchmarks.generators import (
+    long_expression, large_program, print_program, variable_program,
+)
+from pythonpy.lexer import tokenize_line, tokenize_program, tokenize_stream
+
+
+def throughput(func, text, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(text)
+        best = min(best, time.perf_counter() - start)
+    return len(text.encode()) / best / 1e6
+
+
+# The per-character lexer the regex lexers replaced, as it was, kept as the
+# baseline they are measured against. It slices the rest of the line at
+# every character, so it is quadratic in line length and only run on
+# programs of ordinary lines.
+@dataclass
+class CharLoopToken:
+    type: str
+    value: str
+
+
+def char_loop_tokenize_program(code):
+    lines = code.splitlines()
+    return [char_loop_tokenize_line(line) for line in lines if line.strip()]
+
+
+def char_loop_tokenize_line(line):
+    tokens = []
+    i = 0
+
+    while i < len(line):
+        c = line[i]
+
+        if c in " \t\n":
+            i += 1
+
+        elif line[i:].startswith("print", i):
+            tokens.append(CharLoopToken("PRINT", "print"))
+            i += 5
+
+        elif c == "(":
+            tokens.append(CharLoopToken("LPAREN", c))
+            i += 1
+
+        elif c == ")":
+            tokens.append(CharLoopToken("RPAREN", c))
+            i += 1
+
+        elif c == "+":
+            tokens.append(CharLoopToken("PLUS", c))
+            i += 1
+
+        elif c == "-":
+            tokens.append(CharLoopToken("MINUS", c))
+            i += 1
+
+        elif c == "*":
+            tokens.append(CharLoopToken("MULTIPLY", c))
+            i += 1
+
+        elif c == "/":
+            tokens.append(CharLoopToken("DIVIDE", c))
+            i += 1
+
+        elif c == "=":
+            tokens.append(CharLoopToken("EQUALS", c))
+            i += 1
+
+        elif c.isdigit():
+            start = i
+            while i < len(line) and line[i].isdigit():
+                i += 1
+            number = line[start:i]
+            tokens.append(CharLoopToken("NUMBER", number))
+
+        elif c.isalpha():
+            start = i
+            while i < len(line) and line[i].isalnum():
+                i += 1
+            ident = line[start:i]
+            tokens.append(CharLoopToken("IDENTIFIER", ident))
+
+        else:
+            raise SyntaxError(f"Unexpected character: '{c}' at position {i}")
+
+    return tokens
+
+
+def main():
+    print(f"tokenize_line, long expression: "
+          f"{throughput(tokenize_line, long_expression(200_000)):.2f} MB/s")
+
+    programs = [
+        ("large program", large_program(100_000)),
+        ("print lines", print_program(100_000)),
+        ("variables", variable_program(50, 50_000)),
+    ]
+    lexers = [
+        ("character loop", char_loop_tokenize_program),
+        ("tokenize_program", tokenize_program),
+        ("tokenize_stream", tokenize_stream),
+    ]
+    for name, code in programs:
+        rates = [throughput(func, code) for _, func in lexers]
+        print(f"{name}: " + ", ".join(
+            f"{label} {rate:.2f} MB/s ({rate / rates[0]:.2f}x)"
+            for (label, _), rate in zip(lexers, rates)
+        ))
+
+
+if __name__ == "__main__":
+    main()
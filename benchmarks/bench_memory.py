@@ -0,0 +1,36 @@
+import gc
+import tracemalloc
+
+from benchmarks.generators import large_program
+from pythonpy.flat import flatten
+from pythonpy.lexer import tokenize_program, tokenize_stream
+from pythonpy.parser import parse_program
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def main(lines=100_000):
+    code = large_program(lines)
+    token_lines, tokens_size = measure(lambda: tokenize_program(code))
+    del token_lines
+    stream, stream_size = measure(lambda: tokenize_stream(code))
+    program, ast_size = measure(lambda: parse_program(stream))
+    del stream
+    _, flat_size = measure(lambda: flatten(program))
+    print(f"{lines} statements")
+    print(f"tokens:     {tokens_size / 1e6:8.2f} MB")
+    print(f"stream:     {stream_size / 1e6:8.2f} MB")
+    print(f"AST nodes:  {ast_size / 1e6:8.2f} MB")
+    print(f"flat AST:   {flat_size / 1e6:8.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
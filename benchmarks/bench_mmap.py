@@ -0,0 +1,39 @@
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.generators import arithmetic_program
+from pythonpy.main import main as run
+
+
+def measure(path, mapped):
+    with open(path, "rb" if mapped else "r") as fin, \
+            open(os.devnull, "w") as fout:
+        start = time.perf_counter()
+        run(fin, fout, mapped=mapped)
+        elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    with open(path, "rb" if mapped else "r") as fin, \
+            open(os.devnull, "w") as fout:
+        run(fin, fout, mapped=mapped)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main(lines=20_000):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "program.py")
+        with open(path, "w") as f:
+            f.write(arithmetic_program(lines, 4))
+        print(f"{lines} statements, {os.path.getsize(path) / 1e6:.2f} MB")
+        for label, mapped in [("read", False), ("mapped", True)]:
+            elapsed, peak = measure(path, mapped)
+            print(f"{label:7} {elapsed * 1000:8.1f} ms  "
+                  f"peak {peak / 1e6:8.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
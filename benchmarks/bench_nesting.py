@@ -0,0 +1,30 @@
+import io
+import sys
+import time
+
+from benchmarks.generators import nested_parens, left_chain
+from pythonpy.evaluator import evaluate
+from pythonpy.lexer import tokenize_program
+from pythonpy.parser import parse_program
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main(depths=(10**5, 10**6)):
+    for name, generate in [("nested parens", nested_parens),
+                           ("left chain", left_chain)]:
+        for depth in depths:
+            token_lines, lex = timed(tokenize_program, generate(depth))
+            program, parse = timed(parse_program, token_lines)
+            del token_lines
+            _, run = timed(evaluate, program, {}, io.StringIO())
+            print(f"{name} {depth:>8}: lex {lex:6.2f}s  "
+                  f"parse {parse:6.2f}s  evaluate {run:6.2f}s")
+
+
+if __name__ == "__main__":
+    main(tuple(int(arg) for arg in sys.argv[1:]) or (10**5, 10**6))
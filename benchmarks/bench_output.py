@@ -0,0 +1,31 @@
+import os
+import time
+
+from benchmarks.generators import print_program
+from pythonpy.lexer import tokenize_program
+from pythonpy.main import BACKENDS
+from pythonpy.output import OutputBuffer
+from pythonpy.parser import parse_program
+
+
+def main(lines=200_000):
+    program = parse_program(tokenize_program(print_program(lines)))
+    # Line buffering matches stdout attached to a terminal or a pipe reader
+    # that expects prompt lines.
+    with open(os.devnull, "w", buffering=1) as devnull:
+        for backend in ("tree", "vm"):
+            execute = BACKENDS[backend]
+            for label, buffer_size in [("unbuffered", 0),
+                                       ("buffered", 64 * 1024)]:
+                start = time.perf_counter()
+                if buffer_size:
+                    with OutputBuffer(devnull, buffer_size) as out:
+                        execute(program, {}, out)
+                else:
+                    execute(program, {}, devnull)
+                elapsed = time.perf_counter() - start
+                print(f"{backend:5} {label:10} {elapsed * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.generators import arithmetic_program
+from pythonpy.lexer import tokenize_program
+from pythonpy.parallel import parse_parallel
+from pythonpy.parser import parse_program
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def main(lines=20_000, max_workers=None):
+    max_workers = max_workers or os.cpu_count() or 1
+    code = arithmetic_program(lines, 4)
+    print(f"{lines} statements, {len(code) / 1e6:.2f} MB, "
+          f"{os.cpu_count()} cores")
+
+    serial, expected = timed(lambda: parse_program(tokenize_program(code)))
+    print(f"serial:      {serial * 1000:8.1f} ms")
+    # Keeping the whole serial tree alive would slow every later run
+    # through the garbage collector, so only positions are compared.
+    expected = [statement.pos for statement in expected.statements]
+
+    workers = 1
+    while workers <= max_workers:
+        # Workers are started beforehand; a long-lived caller pays that once.
+        with ProcessPoolExecutor(workers) as executor:
+            executor.submit(int).result()
+            elapsed, program = timed(
+                lambda: parse_parallel(code, executor, workers)
+            )
+        assert [s.pos for s in program.statements] == expected
+        print(f"{workers:3} workers: {elapsed * 1000:8.1f} ms  "
+              f"{serial / elapsed:5.2f}x vs serial")
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main(max_workers=int(sys.argv[1]) if len(sys.argv) > 1 else None)
@@ -0,0 +1,48 @@
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.generators import independent_squarings
+from pythonpy.evaluator import evaluate
+from pythonpy.lexer import tokenize_program
+from pythonpy.parser import parse_program
+from pythonpy.scheduler import evaluate_parallel
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def main(chains=4, squarings=22, max_workers=None):
+    max_workers = max_workers or os.cpu_count() or 1
+    program = parse_program(
+        tokenize_program(independent_squarings(chains, squarings))
+    )
+    print(f"{chains} chains of {squarings} squarings, "
+          f"{os.cpu_count()} cores")
+
+    fout = io.StringIO()
+    sequential = timed(lambda: evaluate(program, {}, fout))
+    expected = fout.getvalue()
+    print(f"sequential:  {sequential * 1000:8.1f} ms")
+
+    workers = 1
+    while workers <= max_workers:
+        with ProcessPoolExecutor(workers) as executor:
+            executor.submit(int).result()
+            fout = io.StringIO()
+            elapsed = timed(
+                lambda: evaluate_parallel(program, {}, fout, executor)
+            )
+        assert fout.getvalue() == expected
+        print(f"{workers:3} workers: {elapsed * 1000:8.1f} ms  "
+              f"{sequential / elapsed:5.2f}x vs sequential")
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main(max_workers=int(sys.argv[1]) if len(sys.argv) > 1 else None)
@@ -0,0 +1,47 @@
+import json
+import subprocess
+import sys
+import time
+
+PROGRAM = "x = 12345\nprint(x * 2 + 1)"
+
+RUN_ONCE = (
+    "import io, sys; from pythonpy.main import main; "
+    "main(io.StringIO(sys.argv[1]), sys.stdout)"
+)
+
+
+def main(programs=50):
+    start = time.perf_counter()
+    for _ in range(programs):
+        subprocess.run([sys.executable, "-c", RUN_ONCE, PROGRAM],
+                       check=True, capture_output=True)
+    elapsed = time.perf_counter() - start
+    print(f"process per program  {elapsed / programs * 1000:8.3f} ms")
+
+    process = subprocess.Popen(
+        [sys.executable, "-m", "pythonpy.session"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+    )
+    request = json.dumps({"code": PROGRAM}) + "\n"
+    for label, pipelined in [("session round trip", False),
+                             ("session pipelined", True)]:
+        start = time.perf_counter()
+        if pipelined:
+            process.stdin.write(request * programs)
+            process.stdin.flush()
+            for _ in range(programs):
+                process.stdout.readline()
+        else:
+            for _ in range(programs):
+                process.stdin.write(request)
+                process.stdin.flush()
+                process.stdout.readline()
+        elapsed = time.perf_counter() - start
+        print(f"{label:20} {elapsed / programs * 1000:8.3f} ms")
+    process.stdin.close()
+    process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import io
+import time
+import timeit
+
+from benchmarks.generators import variable_program
+from pythonpy.evaluator import evaluate
+from pythonpy.flat import flatten, evaluate_flat
+from pythonpy.lexer import tokenize_program
+from pythonpy.parser import parse_program
+from pythonpy.symbols import SymbolTable, SlotEnvironment, UNDEFINED
+
+
+def lookups(number=5_000_000):
+    env = {f"v{i}": i for i in range(100)}
+    symbols = SymbolTable(env)
+    namespace = {
+        "env": env,
+        "name": "v42",
+        "slots": SlotEnvironment(symbols, env).values,
+        "slot": symbols.slot("v42"),
+        "UNDEFINED": UNDEFINED,
+    }
+    cases = [
+        ("dict 'in' + [] lookup", "name in env\nenv[name]"),
+        ("dict single lookup", "env[name]"),
+        ("slot lookup + check", "slots[slot] is UNDEFINED"),
+    ]
+    for label, stmt in cases:
+        seconds = min(timeit.repeat(stmt, globals=namespace, number=number))
+        print(f"{label:24} {seconds / number * 1e9:6.1f} ns/lookup")
+
+
+def programs():
+    program = parse_program(tokenize_program(variable_program(50, 20_000)))
+    flat_program = flatten(program)
+    for label, func, node in [("tree, dict env", evaluate, program),
+                              ("flat, slot env", evaluate_flat,
+                               flat_program)]:
+        start = time.perf_counter()
+        func(node, {}, io.StringIO())
+        elapsed = time.perf_counter() - start
+        print(f"{label:24} {elapsed * 1000:6.1f} ms")
+
+
+if __name__ == "__main__":
+    lookups()
+    programs()
@@ -0,0 +1,65 @@
+def long_expression(terms):
+    return "print(" + "+".join(f"{i}*{i % 7 + 1}" for i in range(terms)) + ")"
+
+
+def large_program(lines):
+    return "\n".join(
+        f"v{i} = (v{i - 1} + {i}) * 3 / 3 - {i} / 7" if i else "v0 = 1"
+        for i in range(lines)
+    )
+
+
+def arithmetic_program(lines, depth):
+    expr = "x"
+    for i in range(depth):
+        k = i % 5 + 1
+        expr = f"({expr} - x * {k} / {k} + x + {i})"
+    body = [f"x = {expr} - {depth * (depth - 1) // 2}" for _ in range(lines)]
+    return "\n".join(["x = 1", *body, "print(x)"])
+
+
+def nested_parens(depth):
+    return "print(" + "(" * depth + "1" + "+1)" * depth + ")"
+
+
+def left_chain(length):
+    return "x = 1\nprint(" + "+".join(["x"] * length) + ")"
+
+
+def variable_program(variables, lines):
+    body = [f"v{i} = {i}" for i in range(variables)]
+    for i in range(lines):
+        names = [f"v{(i + k) % variables}" for k in range(8)]
+        body.append(f"v{i % variables} = " + " + ".join(names) + " - "
+                    + " - ".join(names[1:]))
+    body.append("print(v0)")
+    return "\n".join(body)
+
+
+def print_program(lines):
+    return "\n".join(["x = 12345"] + ["print(x)"] * lines)
+
+
+def repeated_subexpressions(lines, repeats):
+    # Each line repeats (a*b+c) and (d*e+a*b); every tenth line rebinds c.
+    shared = ["(a*b+c)", "(d*e+a*b)"]
+    body = ["a = 3", "b = 5", "c = 7", "d = 11", "e = 13"]
+    for i in range(lines):
+        if i % 10 == 9:
+            body.append(f"c = c + {i % 3} - 1")
+        else:
+            terms = [shared[k % 2] for k in range(repeats)]
+            body.append(f"x{i % 10} = " + " + ".join(terms) + f" * {i % 5}")
+    body.append("print(x0 + x1)")
+    return "\n".join(body)
+
+
+def independent_squarings(chains, squarings):
+    # Interleaved chains of repeated squaring; each chain depends only on
+    # itself, so the chains can run in parallel.
+    body = [f"c{k} = {k + 2}" for k in range(chains)]
+    for _ in range(squarings):
+        body.extend(f"c{k} = c{k} * c{k}" for k in range(chains))
+    total = " + ".join(f"c{k}" for k in range(chains))
+    body.append(f"print(({total}) / ({total}))")
+    return "\n".join(body)
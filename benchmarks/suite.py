@@ -0,0 +1,164 @@
+import argparse
+import gc
+import io
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from benchmarks import generators
+from pythonpy import __version__
+from pythonpy.evaluator import evaluate
+from pythonpy.lexer import tokenize_stream
+from pythonpy.main import main as run_main
+from pythonpy.parser import parse_program
+
+FORMAT = 1
+
+CASES = {
+    "long_expression": lambda scale: generators.long_expression(
+        20_000 * scale),
+    "deep_nesting": lambda scale: generators.nested_parens(20_000 * scale),
+    "many_variables": lambda scale: generators.variable_program(
+        200, 5_000 * scale),
+    "many_prints": lambda scale: generators.print_program(50_000 * scale),
+    "large_program": lambda scale: generators.large_program(
+        20_000 * scale),
+}
+
+STAGES = ["lex", "parse", "evaluate", "main"]
+
+
+def _stage_functions(code):
+    # The stages main() itself runs.
+    stream = tokenize_stream(code)
+    program = parse_program(stream)
+    return {
+        "lex": lambda: tokenize_stream(code),
+        "parse": lambda: parse_program(stream),
+        "evaluate": lambda: evaluate(program, {}, io.StringIO()),
+        "main": lambda: run_main(io.StringIO(code), io.StringIO()),
+    }
+
+
+def _best_time(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _peak_memory(func):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(cases=None, scale=1, repeat=3):
+    results = {}
+    for name in cases or CASES:
+        code = CASES[name](scale)
+        functions = _stage_functions(code)
+        results[name] = {
+            stage: {
+                "seconds": round(_best_time(functions[stage], repeat), 6),
+                "peak_bytes": _peak_memory(functions[stage]),
+            }
+            for stage in STAGES
+        }
+        del functions
+
+    return {
+        "format": FORMAT,
+        "pythonpy": __version__,
+        "python": platform.python_version(),
+        "scale": scale,
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold=0.1, memory_threshold=0.1):
+    regressions = []
+    lines = [f"{'case':<18} {'stage':<9} {'time':>9} {'memory':>9}"]
+
+    for name, stages in sorted(current["results"].items()):
+        for stage, now in stages.items():
+            before = baseline["results"].get(name, {}).get(stage)
+            if before is None:
+                lines.append(f"{name:<18} {stage:<9} {'new':>9} {'new':>9}")
+                continue
+
+            time_ratio = now["seconds"] / max(before["seconds"], 1e-9)
+            memory_ratio = now["peak_bytes"] / max(before["peak_bytes"], 1)
+            flags = []
+            if time_ratio > 1 + threshold:
+                flags.append("time")
+            if memory_ratio > 1 + memory_threshold:
+                flags.append("memory")
+            if flags:
+                regressions.append((name, stage, flags))
+
+            marker = "  REGRESSION " + ",".join(flags) if flags else ""
+            lines.append(
+                f"{name:<18} {stage:<9} {time_ratio:>8.2f}x "
+                f"{memory_ratio:>8.2f}x{marker}"
+            )
+
+    return regressions, "\n".join(lines)
+
+
+def _main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("-o", "--output", help="write JSON here")
+    run_parser.add_argument("--case", action="append", choices=list(CASES))
+    run_parser.add_argument("--scale", type=int, default=1)
+    run_parser.add_argument("--repeat", type=int, default=3)
+
+    compare_parser = commands.add_parser(
+        "compare", help="flag regressions against a saved baseline"
+    )
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+    compare_parser.add_argument("--memory-threshold", type=float,
+                                default=0.1)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        report = run(args.case, args.scale, args.repeat)
+        text = json.dumps(report, indent=2, sort_keys=True) + "\n"
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(text)
+        else:
+            sys.stdout.write(text)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    regressions, table = compare(
+        baseline, current, args.threshold, args.memory_threshold
+    )
+    print(table)
+    if regressions:
+        print(f"{len(regressions)} regression(s)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
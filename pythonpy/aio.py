@@ -0,0 +1,63 @@
+import asyncio
+import io
+
+from .evaluator import evaluate
+from .lexer import tokenize_lines
+from .parser import parse_statements
+from .source import LineSourceMap, locate, set_position
+
+DEFAULT_YIELD_EVERY = 100
+
+
+async def main_async(reader, writer, yield_every=DEFAULT_YIELD_EVERY,
+                     encoding="utf-8"):
+    env = {}
+    buffer = io.StringIO()
+    count = 0
+    # Offsets count characters from the start of the input, as they would
+    # if it had been read as a whole.
+    source_map = LineSourceMap()
+    offset = 0
+
+    try:
+        async for line in reader:
+            if isinstance(line, bytes):
+                line = line.decode(encoding)
+            token_lines = tokenize_lines([line], source_map, offset)
+            for statement in parse_statements(token_lines):
+                try:
+                    evaluate(statement, env, buffer)
+                except (NameError, ValueError) as error:
+                    raise set_position(error, statement.pos)
+                count += 1
+                if count % yield_every == 0:
+                    await _flush(buffer, writer, encoding)
+                    await asyncio.sleep(0)
+            offset += len(line)
+    except (SyntaxError, NameError, ValueError) as error:
+        raise locate(error, source_map)
+    finally:
+        await _flush(buffer, writer, encoding)
+
+
+async def evaluate_async(node, env, writer, yield_every=DEFAULT_YIELD_EVERY,
+                         encoding="utf-8"):
+    buffer = io.StringIO()
+
+    try:
+        for count, statement in enumerate(node.statements, 1):
+            evaluate(statement, env, buffer)
+            if count % yield_every == 0:
+                await _flush(buffer, writer, encoding)
+                await asyncio.sleep(0)
+    finally:
+        await _flush(buffer, writer, encoding)
+
+
+async def _flush(buffer, writer, encoding):
+    data = buffer.getvalue()
+    if data:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.write(data.encode(encoding))
+        await writer.drain()
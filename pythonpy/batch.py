@@ -0,0 +1,52 @@
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from .main import main
+
+
+class BatchResult:
+    __slots__ = ("output", "error")
+
+    def __init__(self, output, error=None):
+        self.output = output
+        self.error = error
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, BatchResult)
+            and self.output == other.output
+            and type(self.error) is type(other.error)
+            and getattr(self.error, "args", None)
+            == getattr(other.error, "args", None)
+        )
+
+    def __repr__(self):
+        return f"BatchResult({self.output!r}, error={self.error!r})"
+
+
+def run_program(code, **options):
+    fout = io.StringIO()
+    try:
+        main(io.StringIO(code), fout, **options)
+    except Exception as error:
+        return BatchResult(fout.getvalue(), error)
+    return BatchResult(fout.getvalue())
+
+
+def run_batch(sources, max_workers=None, chunksize=None, **options):
+    sources = list(sources)
+    if not sources:
+        return []
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if chunksize is None:
+        # A few chunks per worker balances load while amortizing IPC.
+        chunksize = max(1, len(sources) // (max_workers * 4))
+
+    with ProcessPoolExecutor(max_workers) as executor:
+        return list(executor.map(
+            partial(run_program, **options), sources, chunksize=chunksize
+        ))
@@ -0,0 +1,146 @@
+import time
+
+from .evaluator import evaluate, OPERATORS
+from .nodes import ProgramNode, AssignNode
+from .source import set_position
+
+# Limits for running untrusted programs, checked once per statement
+# wherever that is enough. Addition and subtraction add at most one bit
+# per operation and division only shrinks values, so within a statement
+# only multiplication can grow integers, or take time, without bound.
+# Multiplication alone is wrapped with per-operation checks, and only when
+# an integer size or time limit is set. Every other limit costs nothing
+# inside expressions.
+
+# Multiplications between clock reads inside a statement.
+TIME_CHECK_INTERVAL = 1024
+
+
+class BudgetExceeded(RuntimeError):
+    def __init__(self, limit, usage):
+        super().__init__(f"Budget exceeded: {limit}")
+        self.limit = limit
+        self.usage = usage
+
+    def __reduce__(self):
+        # Rebuilt from its own arguments rather than self.args, so it
+        # survives pickling, e.g. back from a batch worker, along with
+        # the position and notes main() added.
+        return type(self), (self.limit, self.usage), self.__dict__
+
+
+class Budget:
+    def __init__(self, max_statements=None, max_time=None, max_bits=None,
+                 max_variables=None, clock=time.perf_counter):
+        self.max_statements = max_statements
+        self.max_time = max_time
+        self.max_bits = max_bits
+        self.max_variables = max_variables
+        self.clock = clock
+        self.reset()
+
+    def reset(self):
+        self.statements = 0
+        self.largest_bits = 0
+        self.variables = 0
+        self.started = self.clock()
+
+    @property
+    def elapsed(self):
+        return self.clock() - self.started
+
+    def usage(self):
+        return {
+            "statements": self.statements,
+            "time": self.elapsed,
+            "largest_bits": self.largest_bits,
+            "variables": self.variables,
+        }
+
+    def exceeded(self, limit):
+        return BudgetExceeded(limit, self.usage())
+
+    def evaluate(self, node, env, fout, operators=OPERATORS):
+        if not isinstance(node, ProgramNode):
+            raise TypeError("Unknown node type")
+
+        self.reset()
+        operators = self.operators(operators)
+        max_statements = self.max_statements
+        max_time = self.max_time
+        max_bits = self.max_bits
+        max_variables = self.max_variables
+        count = 0
+        try:
+            for statement in node.statements:
+                count += 1
+                if max_statements is not None and count > max_statements:
+                    raise self.exceeded("statements")
+                if max_time is not None and self.elapsed > max_time:
+                    raise self.exceeded("time")
+
+                evaluate(statement, env, fout, operators)
+
+                if isinstance(statement, AssignNode):
+                    if max_bits is not None:
+                        self.check_bits(env[statement.var_name])
+                    if max_variables is not None and (
+                        len(env) > max_variables
+                    ):
+                        raise self.exceeded("variables")
+        except (NameError, ValueError, BudgetExceeded) as error:
+            self.statements = count
+            self.variables = len(env)
+            if isinstance(error, BudgetExceeded):
+                error.usage = self.usage()
+            raise set_position(error, statement.pos)
+        self.statements = count
+        self.variables = len(env)
+
+    def check_bits(self, value):
+        bits = value.bit_length()
+        if bits > self.largest_bits:
+            self.largest_bits = bits
+            if bits > self.max_bits:
+                raise self.exceeded("bits")
+
+    def operators(self, operators=OPERATORS):
+        if self.max_bits is None and self.max_time is None:
+            return operators
+        return {**operators, "*": self._checked(operators["*"])}
+
+    def _checked(self, multiply):
+        max_bits = self.max_bits
+        max_time = self.max_time
+        count = 0
+
+        def timed(left, right):
+            nonlocal count
+            count += 1
+            if count % TIME_CHECK_INTERVAL == 0 and self.elapsed > max_time:
+                raise self.exceeded("time")
+            return multiply(left, right)
+
+        if max_bits is None:
+            return timed
+        compute = multiply if max_time is None else timed
+
+        # Factors below this bound cannot make an oversized product, so the
+        # common case needs no bit counting.
+        high = 1 << (max_bits // 2)
+        low = -high
+
+        def sized(left, right):
+            if low < left < high and low < right < high:
+                return compute(left, right)
+            # A product has at least this many bits, so an oversized one is
+            # refused before any time is spent computing it.
+            if left and right and (
+                left.bit_length() + right.bit_length() - 1 > max_bits
+            ):
+                raise self.exceeded("bits")
+            result = compute(left, right)
+            self.check_bits(result)
+            return result
+
+        return sized
@@ -0,0 +1,170 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+from . import __version__
+from .flat import flatten, unflatten
+from .lexer import tokenize_stream
+from .parser import parse_program
+
+# Bump when the pickled layout changes; entries written by any other
+# pythonpy version or format are discarded.
+CACHE_FORMAT = 2
+STAMP = f"{__version__}-{CACHE_FORMAT}"
+SUFFIX = ".pythonpy-cache"
+
+
+def program_key(code):
+    return hashlib.sha256(code.encode()).hexdigest()
+
+
+class CacheStats:
+    __slots__ = ("hits", "misses", "time_saved")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.time_saved = 0.0
+
+    def __repr__(self):
+        return (
+            f"CacheStats(hits={self.hits}, misses={self.misses}, "
+            f"time_saved={self.time_saved:.6f}s)"
+        )
+
+
+class ProgramCache:
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        os.makedirs(directory, exist_ok=True)
+        self._remove_stale()
+
+    def get_program(self, code):
+        program = self.load(code)
+        if program is None:
+            start = time.perf_counter()
+            program = parse_program(tokenize_stream(code))
+            self.store(code, program, time.perf_counter() - start)
+        return program
+
+    def load(self, code):
+        path = self._path(code)
+        start = time.perf_counter()
+        try:
+            with open(path, "rb") as f:
+                stamp, parse_time, flat_program = pickle.load(f)
+            if stamp != STAMP:
+                raise ValueError("Stale cache entry")
+            program = unflatten(flat_program)
+        except FileNotFoundError:
+            self.stats.misses += 1
+            return None
+        except (OSError, EOFError, ValueError, TypeError, AttributeError,
+                pickle.UnpicklingError):
+            self._remove(path)
+            self.stats.misses += 1
+            return None
+
+        os.utime(path)
+        self.stats.hits += 1
+        self.stats.time_saved += parse_time - (time.perf_counter() - start)
+        return program
+
+    def store(self, code, program, parse_time):
+        data = pickle.dumps(
+            (STAMP, parse_time, flatten(program)), pickle.HIGHEST_PROTOCOL
+        )
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(code))
+        except OSError:
+            self._remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(SUFFIX):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(SUFFIX):
+                self._remove(entry.path)
+
+    def _path(self, code):
+        return os.path.join(
+            self.directory, f"{program_key(code)}-{STAMP}{SUFFIX}"
+        )
+
+    def _remove_stale(self):
+        for entry in os.scandir(self.directory):
+            if (
+                entry.name.endswith(SUFFIX)
+                and not entry.name.endswith(f"-{STAMP}{SUFFIX}")
+            ):
+                self._remove(entry.path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class CompiledCache:
+    # A backend's compiled form of recently run programs, kept in memory by
+    # ProgramNode.key so that a program run again is not compiled again.
+    # Programs without a key are compiled every time.
+    def __init__(self, compile, max_entries=16):
+        self.compile = compile
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, program):
+        key = program.key
+        if key is None:
+            return self.compile(program)
+
+        with self._lock:
+            compiled = self._entries.pop(key, None)
+        if compiled is None:
+            self.stats.misses += 1
+            compiled = self.compile(program)
+        else:
+            self.stats.hits += 1
+
+        # Entries are kept in order of use, least recent first.
+        with self._lock:
+            self._entries[key] = compiled
+            while len(self._entries) > self.max_entries:
+                del self._entries[next(iter(self._entries))]
+        return compiled
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,241 @@
+from functools import lru_cache, partial
+
+from .cache import CompiledCache
+from .evaluator import evaluate, divide
+from .nodes import ProgramNode, PrintNode, BinOpNode, AssignNode, NameNode
+from .source import set_position
+
+
+# Statements are compiled together into one function per batch, which
+# saves the Python compiler's per-call overhead. Compiling a statement still
+# costs several times more than walking its tree once, so a program's first
+# run is slower than the tree-walker's. Compiled code pays off when it runs
+# again: programs that main() read whole are kept by their key, and batch
+# code is cached by its source text.
+BATCH_SIZE = 256
+
+
+def compile_program(node):
+    if not isinstance(node, ProgramNode):
+        raise TypeError("Unknown node type")
+
+    statements = node.statements
+    batches = [
+        _compile_batch(statements[start:start + BATCH_SIZE])
+        for start in range(0, len(statements), BATCH_SIZE)
+    ]
+
+    def run(env, fout):
+        for batch in batches:
+            batch(env, fout)
+
+    return run
+
+
+_programs = CompiledCache(compile_program)
+
+
+def execute(node, env, fout):
+    if isinstance(node.statements, list):
+        _programs.get(node)(env, fout)
+    else:
+        # Streamed statements are compiled as they arrive, so output is
+        # not held back waiting for a batch to fill.
+        for statement in node.statements:
+            _compile_batch([statement])(env, fout)
+
+
+def _compile_statement_fallback(node):
+    try:
+        return _compile_statement_closure(node)
+    except RecursionError:
+        return partial(evaluate, node)
+
+
+def _compile_batch(statements):
+    try:
+        return _compile_batch_source(statements)
+    except (RecursionError, SyntaxError, MemoryError):
+        pass
+
+    if len(statements) > 1:
+        runs = [_compile_batch([statement]) for statement in statements]
+
+        def run(env, fout):
+            for statement in runs:
+                statement(env, fout)
+
+        return run
+
+    statement = statements[0]
+    compiled = _compile_statement_fallback(statement)
+
+    def run(env, fout):
+        try:
+            compiled(env, fout)
+        except (NameError, ValueError) as error:
+            raise set_position(error, statement.pos)
+
+    return run
+
+
+def _unknown_operator(left, right, op):
+    raise ValueError(f"Unknown operator: {op}")
+
+
+def _unsupported_expression():
+    raise TypeError("Unsupported expression node")
+
+
+_RUNTIME = {
+    "_divide": divide,
+    "_unknown_operator": _unknown_operator,
+    "_unsupported_expression": _unsupported_expression,
+}
+
+# The generated code tracks which statement is running, so an error can
+# be given that statement's position.
+_BATCH_TEMPLATE = """\
+def run(env, fout):
+    statement = 0
+    try:
+{body}
+    except KeyError as error:
+        raise _set_position(
+            NameError(f"Undefined variable: {{error.args[0]}}"),
+            _positions[statement],
+        ) from None
+    except (NameError, ValueError) as error:
+        raise _set_position(error, _positions[statement])
+"""
+
+
+def _compile_batch_source(statements):
+    lines = []
+    for index, statement in enumerate(statements):
+        if index:
+            lines.append(f"        statement = {index}")
+        lines.append(f"        {statement_source(statement)}")
+
+    namespace = dict(_RUNTIME)
+    namespace["_set_position"] = set_position
+    namespace["_positions"] = [statement.pos for statement in statements]
+    exec(_compile_source(_BATCH_TEMPLATE.format(body="\n".join(lines))),
+         namespace)
+    return namespace["run"]
+
+
+@lru_cache(maxsize=64)
+def _compile_source(source):
+    # Positions are kept out of the source, so repeated batches, within a
+    # program or across runs of it, share one code object.
+    return compile(source, "<pythonpy>", "exec")
+
+
+def statement_source(node):
+    if isinstance(node, PrintNode):
+        if node.value is None:
+            return 'fout.write("\\n")'
+        return f'fout.write(str({expr_source(node.value)}) + "\\n")'
+
+    elif isinstance(node, AssignNode):
+        return f"env[{node.var_name!r}] = {expr_source(node.expr)}"
+
+    else:
+        return 'raise TypeError("Unknown node type")'
+
+
+def expr_source(expr):
+    if isinstance(expr, int):
+        return f"({expr!r})"
+
+    elif isinstance(expr, BinOpNode):
+        left = expr_source(expr.left)
+        right = expr_source(expr.right)
+        if expr.op in ("+", "-", "*"):
+            return f"({left} {expr.op} {right})"
+        elif expr.op == "/":
+            return f"_divide({left}, {right})"
+        else:
+            return f"_unknown_operator({left}, {right}, {expr.op!r})"
+
+    elif isinstance(expr, NameNode):
+        return f"env[{expr.var_name!r}]"
+
+    else:
+        return "_unsupported_expression()"
+
+
+def _compile_statement_closure(node):
+    if isinstance(node, PrintNode):
+        if node.value is None:
+            def run(env, fout):
+                fout.write("\n")
+        else:
+            value = compile_expr(node.value)
+
+            def run(env, fout):
+                fout.write(f"{value(env)}\n")
+
+    elif isinstance(node, AssignNode):
+        var_name = node.var_name
+        expr = compile_expr(node.expr)
+
+        def run(env, fout):
+            env[var_name] = expr(env)
+
+    else:
+        def run(env, fout):
+            raise TypeError("Unknown node type")
+
+    return run
+
+
+def compile_expr(expr):
+    if isinstance(expr, int):
+        def run(env):
+            return expr
+
+    elif isinstance(expr, BinOpNode):
+        run = _compile_binop(
+            compile_expr(expr.left), expr.op, compile_expr(expr.right)
+        )
+
+    elif isinstance(expr, NameNode):
+        var_name = expr.var_name
+
+        def run(env):
+            try:
+                return env[var_name]
+            except KeyError:
+                raise NameError(f"Undefined variable: {var_name}") from None
+
+    else:
+        def run(env):
+            raise TypeError("Unsupported expression node")
+
+    return run
+
+
+def _compile_binop(left, op, right):
+    if op == "+":
+        def run(env):
+            return left(env) + right(env)
+
+    elif op == "-":
+        def run(env):
+            return left(env) - right(env)
+
+    elif op == "*":
+        def run(env):
+            return left(env) * right(env)
+
+    elif op == "/":
+        def run(env):
+            return divide(left(env), right(env))
+
+    else:
+        def run(env):
+            _unknown_operator(left(env), right(env), op)
+
+    return run
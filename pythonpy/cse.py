@@ -0,0 +1,116 @@
+from . import evaluator
+from .evaluator import OPERATORS
+from .nodes import ProgramNode, BinOpNode, NameNode
+
+# Common subexpression elimination in two parts. A NodeInterner, passed to
+# the parser, shares structurally identical subtrees within and across
+# statements. SharedEvaluator then computes each distinct BinOpNode once
+# and reuses its value until an assignment rebinds a name it reads.
+
+_MISSING = object()
+
+
+class NodeInterner:
+    __slots__ = ("nodes", "names", "requested")
+
+    def __init__(self):
+        self.nodes = {}
+        self.names = {}
+        self.requested = 0
+
+    def binop(self, left, op, right, pos=None):
+        # Children are interned already, so identity stands for structure;
+        # constants are compared by value. A shared node stands for several
+        # places in the program, so it has no position of its own and errors
+        # are reported at their statement.
+        self.requested += 1
+        left_is_int = left.__class__ is int
+        right_is_int = right.__class__ is int
+        key = (
+            op,
+            left_is_int, left if left_is_int else id(left),
+            right_is_int, right if right_is_int else id(right),
+        )
+        node = self.nodes.get(key)
+        if node is None:
+            node = self.nodes[key] = BinOpNode(left, op, right)
+        return node
+
+    def name(self, var_name, pos=None):
+        self.requested += 1
+        node = self.names.get(var_name)
+        if node is None:
+            node = self.names[var_name] = NameNode(var_name)
+        return node
+
+    def __len__(self):
+        return len(self.nodes) + len(self.names)
+
+    def __repr__(self):
+        return f"NodeInterner({len(self)} nodes, {self.requested} requested)"
+
+
+class SharedEvaluator:
+    # The memo for evaluator.evaluate: every BinOpNode evaluated has its
+    # value cached under its identity. A cached node's children are always
+    # cached too, so an assignment invalidates by walking up from the nodes
+    # reading the rebound name and can stop at the first node that is not
+    # cached.
+    def __init__(self, operators=OPERATORS):
+        self.operators = operators
+        self.values = {}
+        self.hits = 0
+        self.computed = 0
+        # Registered nodes are kept alive so their ids stay unique.
+        self._registered = {}
+        self._parents = {}
+        self._readers = {}
+
+    def evaluate(self, node, env, fout):
+        if not isinstance(node, ProgramNode):
+            raise TypeError("Unknown node type")
+        evaluator.evaluate(node, env, fout, self.operators, self)
+
+    def execute(self, node, env, fout):
+        evaluator.evaluate(node, env, fout, self.operators, self)
+
+    def evaluate_expr(self, expr, env):
+        return evaluator.evaluate_expr(expr, env, self.operators, self)
+
+    def invalidate(self, var_name):
+        values = self.values
+        parents = self._parents
+        stack = [
+            node for node in self._readers.get(var_name, ())
+            if values.pop(id(node), _MISSING) is not _MISSING
+        ]
+        while stack:
+            node = stack.pop()
+            for parent in parents.get(id(node), ()):
+                if values.pop(id(parent), _MISSING) is not _MISSING:
+                    stack.append(parent)
+
+    def register(self, expr):
+        # Records the parents of each node and the nodes reading each name.
+        # A registered node's subtree is registered too, so the walk only
+        # visits nodes it has not seen before.
+        registered = self._registered
+        parents = self._parents
+        readers = self._readers
+        stack = [expr]
+
+        while stack:
+            node = stack.pop()
+            if not isinstance(node, BinOpNode) or id(node) in registered:
+                continue
+            registered[id(node)] = node
+            for child in (node.left, node.right):
+                if isinstance(child, BinOpNode):
+                    parents.setdefault(id(child), []).append(node)
+                    stack.append(child)
+                elif isinstance(child, NameNode):
+                    readers.setdefault(child.var_name, []).append(node)
+
+
+def execute(node, env, fout):
+    SharedEvaluator().evaluate(node, env, fout)
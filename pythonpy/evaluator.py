@@ -1,49 +1,119 @@
+import operator
+
 from .nodes import ProgramNode, PrintNode, BinOpNode, AssignNode, NameNode
+from .source import set_position
+
+
+def divide(left, right):
+    if right == 0:
+        raise ValueError("Division by zero")
+    return left // right
+
 
+OPERATORS = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": divide,
+}
 
-def evaluate(node, env, fout):
+_APPLY = object()
+_MISSING = object()
+
+
+# A memo, such as cse.SharedEvaluator, lets the walk reuse values computed
+# earlier. Its `values` map id(node) to the value of each BinOpNode already
+# evaluated, which is not walked again; `register(expr)` is called before
+# an expression is walked and `invalidate(name)` after a name is assigned,
+# and `hits` and `computed` count reused and newly computed values.
+def evaluate(node, env, fout, operators=OPERATORS, memo=None):
     if isinstance(node, ProgramNode):
         for statement in node.statements:
-            evaluate(statement, env, fout)
+            try:
+                evaluate(statement, env, fout, operators, memo)
+            except (NameError, ValueError) as error:
+                # Programs rebuilt from the cache only keep statement
+                # positions.
+                raise set_position(error, statement.pos)
 
     elif isinstance(node, PrintNode):
         if node.value is None:
-            print(file=fout)
+            fout.write("\n")
         else:
-            result = evaluate_expr(node.value, env)
-            print(result, file=fout)
+            result = evaluate_expr(node.value, env, operators, memo)
+            fout.write(f"{result}\n")
 
     elif isinstance(node, AssignNode):
-        env[node.var_name] = evaluate_expr(node.expr, env)
+        env[node.var_name] = evaluate_expr(node.expr, env, operators, memo)
+        if memo is not None:
+            memo.invalidate(node.var_name)
 
     else:
         raise TypeError("Unknown node type")
 
 
-def evaluate_expr(expr, env):
-    if isinstance(expr, int):
-        return expr
-
-    elif isinstance(expr, BinOpNode):
-        left = evaluate_expr(expr.left, env)
-        right = evaluate_expr(expr.right, env)
-        if expr.op == "+":
-            return left + right
-        elif expr.op == "-":
-            return left - right
-        elif expr.op == "*":
-            return left * right
-        elif expr.op == "/":
-            if right == 0:
-                raise ValueError("Division by zero")
-            return left // right
-        else:
-            raise ValueError(f"Unknown operator: {expr.op}")
+def evaluate_expr(expr, env, operators=OPERATORS, memo=None):
+    # Postorder walk with explicit stacks: `stack` holds nodes still to
+    # visit, `values` the results of finished subtrees, and `pending` the
+    # BinOpNodes waiting for both operands.
+    stack = [expr]
+    values = []
+    pending = []
+    if memo is not None:
+        memo.register(expr)
+        known = memo.values
+        hits = computed = 0
 
-    elif isinstance(expr, NameNode):
-        if expr.var_name not in env:
-            raise NameError(f"Undefined variable: {expr.var_name}")
-        return env[expr.var_name]
+    while stack:
+        item = stack.pop()
 
-    else:
-        raise TypeError("Unsupported expression node")
+        if isinstance(item, BinOpNode):
+            if memo is not None:
+                value = known.get(id(item), _MISSING)
+                if value is not _MISSING:
+                    hits += 1
+                    values.append(value)
+                    continue
+            pending.append(item)
+            stack.append(_APPLY)
+            stack.append(item.right)
+            stack.append(item.left)
+
+        elif isinstance(item, int):
+            values.append(item)
+
+        elif item is _APPLY:
+            node = pending.pop()
+            right = values.pop()
+            left = values.pop()
+            try:
+                function = operators[node.op]
+            except KeyError:
+                raise set_position(
+                    ValueError(f"Unknown operator: {node.op}"), node.pos
+                ) from None
+            try:
+                value = function(left, right)
+            except ValueError as error:
+                raise set_position(error, node.pos)
+            if memo is not None:
+                computed += 1
+                known[id(node)] = value
+            values.append(value)
+
+        elif isinstance(item, NameNode):
+            try:
+                values.append(env[item.var_name])
+            except KeyError:
+                raise set_position(
+                    NameError(f"Undefined variable: {item.var_name}"),
+                    item.pos,
+                ) from None
+
+        else:
+            raise TypeError("Unsupported expression node")
+
+    if memo is not None:
+        memo.hits += hits
+        memo.computed += computed
+    return values[0]
@@ -0,0 +1,229 @@
+from array import array
+
+from .nodes import ProgramNode, PrintNode, BinOpNode, AssignNode, NameNode
+from .symbols import SymbolTable, SlotEnvironment, UNDEFINED
+from .source import set_position
+
+# Expression opcodes. Nodes are stored in postorder, so the right child of
+# a binary node is always the node just before it; its operand holds the
+# index of the left child.
+CONST, NAME, ADD, SUBTRACT, MULTIPLY, DIVIDE = range(6)
+
+# Statement kinds.
+PRINT_EMPTY, PRINT, ASSIGN = range(3)
+
+# Statement positions are kept so runtime errors can name their line; -1
+# stands for an unknown position.
+NO_POSITION = -1
+
+BINARY_OPCODES = {"+": ADD, "-": SUBTRACT, "*": MULTIPLY, "/": DIVIDE}
+BINARY_OPS = {opcode: op for op, opcode in BINARY_OPCODES.items()}
+
+_VISIT = object()
+_LEFT_DONE = object()
+
+
+class FlatProgram:
+    __slots__ = (
+        "opcodes", "operands", "kinds", "targets", "ends", "positions",
+        "constants", "symbols",
+    )
+
+    def __init__(self, symbols=None):
+        self.opcodes = array("B")
+        self.operands = array("q")
+        self.kinds = array("B")
+        self.targets = array("q")
+        self.ends = array("q")
+        self.positions = array("q")
+        self.constants = []
+        self.symbols = SymbolTable() if symbols is None else symbols
+
+    @property
+    def names(self):
+        return self.symbols.names
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __repr__(self):
+        return (
+            f"FlatProgram({len(self.kinds)} statements, "
+            f"{len(self.opcodes)} nodes)"
+        )
+
+
+def flatten(node, symbols=None):
+    if not isinstance(node, ProgramNode):
+        raise TypeError("Unknown node type")
+
+    program = FlatProgram(symbols)
+    constant_index = {}
+    intern_name = program.symbols.resolve
+
+    def intern_constant(value):
+        key = (type(value), value)
+        if key not in constant_index:
+            constant_index[key] = len(program.constants)
+            program.constants.append(value)
+        return constant_index[key]
+
+    for statement in node.statements:
+        if isinstance(statement, PrintNode):
+            if statement.value is None:
+                program.kinds.append(PRINT_EMPTY)
+            else:
+                program.kinds.append(PRINT)
+                _flatten_expr(
+                    statement.value, program, intern_name, intern_constant
+                )
+            program.targets.append(0)
+
+        elif isinstance(statement, AssignNode):
+            program.kinds.append(ASSIGN)
+            _flatten_expr(statement.expr, program, intern_name,
+                          intern_constant)
+            program.targets.append(intern_name(statement.var_name))
+
+        else:
+            raise TypeError("Unknown node type")
+
+        program.ends.append(len(program.opcodes))
+        program.positions.append(
+            NO_POSITION if statement.pos is None else statement.pos
+        )
+
+    return program
+
+
+def _flatten_expr(expr, program, intern_name, intern_constant):
+    opcodes = program.opcodes
+    operands = program.operands
+    # Entries are (node, state): _VISIT for a fresh node, _LEFT_DONE once
+    # its left subtree is emitted, or the index of its left child once
+    # both subtrees are emitted.
+    stack = [(expr, _VISIT)]
+
+    while stack:
+        node, state = stack.pop()
+
+        if isinstance(node, int):
+            opcodes.append(CONST)
+            operands.append(intern_constant(node))
+
+        elif isinstance(node, NameNode):
+            opcodes.append(NAME)
+            operands.append(intern_name(node.var_name))
+
+        elif isinstance(node, BinOpNode):
+            if node.op not in BINARY_OPCODES:
+                raise ValueError(f"Unknown operator: {node.op}")
+            if state is _VISIT:
+                stack.append((node, _LEFT_DONE))
+                stack.append((node.left, _VISIT))
+            elif state is _LEFT_DONE:
+                stack.append((node, len(opcodes) - 1))
+                stack.append((node.right, _VISIT))
+            else:
+                opcodes.append(BINARY_OPCODES[node.op])
+                operands.append(state)
+
+        else:
+            raise TypeError("Unsupported expression node")
+
+
+def unflatten(program):
+    opcodes = program.opcodes
+    operands = program.operands
+    constants = program.constants
+    names = program.names
+    statements = []
+    start = 0
+
+    for kind, target, end, pos in zip(
+        program.kinds, program.targets, program.ends, program.positions
+    ):
+        pos = None if pos == NO_POSITION else pos
+        stack = []
+        for i in range(start, end):
+            opcode = opcodes[i]
+            if opcode == CONST:
+                stack.append(constants[operands[i]])
+            elif opcode == NAME:
+                stack.append(NameNode(names[operands[i]]))
+            else:
+                right = stack.pop()
+                left = stack.pop()
+                stack.append(BinOpNode(left, BINARY_OPS[opcode], right))
+        start = end
+
+        if kind == PRINT_EMPTY:
+            statements.append(PrintNode(pos=pos))
+        elif kind == PRINT:
+            statements.append(PrintNode(stack.pop(), pos))
+        else:
+            statements.append(AssignNode(names[target], stack.pop(), pos))
+
+    return ProgramNode(statements)
+
+
+def evaluate_flat(program, env, fout):
+    environment = SlotEnvironment(program.symbols, env)
+    try:
+        run_flat(program, environment, fout)
+    finally:
+        env.update(environment.to_dict())
+
+
+def run_flat(program, environment, fout):
+    opcodes = program.opcodes
+    operands = program.operands
+    constants = program.constants
+    names = program.names
+    slots = environment.values
+    start = 0
+
+    for kind, target, end, pos in zip(
+        program.kinds, program.targets, program.ends, program.positions
+    ):
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        for i in range(start, end):
+            opcode = opcodes[i]
+            if opcode == CONST:
+                push(constants[operands[i]])
+            elif opcode == NAME:
+                value = slots[operands[i]]
+                if value is UNDEFINED:
+                    raise set_position(NameError(
+                        f"Undefined variable: {names[operands[i]]}"
+                    ), pos)
+                push(value)
+            else:
+                right = pop()
+                left = pop()
+                if opcode == ADD:
+                    push(left + right)
+                elif opcode == SUBTRACT:
+                    push(left - right)
+                elif opcode == MULTIPLY:
+                    push(left * right)
+                else:
+                    if right == 0:
+                        raise set_position(
+                            ValueError("Division by zero"), pos
+                        )
+                    push(left // right)
+        start = end
+
+        if kind == PRINT_EMPTY:
+            fout.write("\n")
+        elif kind == PRINT:
+            fout.write(f"{stack[0]}\n")
+        else:
+            slots[target] = stack[0]
+
+
+def execute(node, env, fout):
+    evaluate_flat(flatten(node), env, fout)
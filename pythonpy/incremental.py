@@ -0,0 +1,171 @@
+from .evaluator import evaluate_expr
+from .lexer import tokenize_line
+from .nodes import PrintNode
+from .parser import parse_statement
+from .source import SourceMap, locate
+from .symbols import names_read
+
+# An IncrementalSession re-runs successive versions of a program, doing
+# only the work an edit makes necessary:
+#
+# - Lines are parsed once and kept keyed by their text, so only edited
+#   lines are lexed and parsed again.
+# - Each completed statement leaves a step recording what it printed, the
+#   value it assigned and the names it read. Statements before the first
+#   edit are replayed from their steps rather than evaluated.
+# - Statements after the last edit are replayed too, unless they read a
+#   name whose value differs from the previous run at that point.
+
+_MISSING = object()
+
+
+class Step:
+    __slots__ = ("node", "reads", "output", "value")
+
+    def __init__(self, node, reads, output=None, value=None):
+        self.node = node
+        self.reads = reads
+        self.output = output
+        self.value = value
+
+    def replay(self, env, fout):
+        if self.output is None:
+            env[self.node.var_name] = self.value
+        else:
+            fout.write(self.output)
+
+    def __repr__(self):
+        return f"Step({self.node})"
+
+
+class IncrementalSession:
+    def __init__(self):
+        self.steps = []
+        self.complete = False
+        self.parsed = 0
+        self.executed = 0
+        self.reused = 0
+        self._lines = {}
+
+    def run(self, code, fout):
+        self.parsed = self.executed = self.reused = 0
+        statements, numbers = self._parse(code)
+
+        old = self.steps
+        limit = min(len(old), len(statements))
+        prefix = 0
+        while prefix < limit and old[prefix].node is statements[prefix][0]:
+            prefix += 1
+        suffix = 0
+        # A run that failed part way has no steps for the end of the
+        # program, so only its prefix can be reused.
+        if self.complete:
+            while (
+                suffix < limit - prefix
+                and old[-1 - suffix].node is statements[-1 - suffix][0]
+            ):
+                suffix += 1
+
+        env = {}
+        steps = []
+        self.steps = steps
+        self.complete = False
+        for step in old[:prefix]:
+            step.replay(env, fout)
+            steps.append(step)
+        self.reused += prefix
+
+        if suffix:
+            old_env = dict(env)
+            for step in old[prefix:len(old) - suffix]:
+                if step.output is None:
+                    old_env[step.node.var_name] = step.value
+
+        index = prefix
+        try:
+            for index in range(prefix, len(statements) - suffix):
+                steps.append(self._execute(*statements[index], env, fout))
+
+            if suffix:
+                dirty = {
+                    name for name in env.keys() | old_env.keys()
+                    if env.get(name, _MISSING) != old_env.get(name, _MISSING)
+                }
+                start = len(statements) - suffix
+                for index, old_step in enumerate(old[-suffix:], start):
+                    if old_step.reads & dirty:
+                        step = self._execute(*statements[index], env, fout)
+                    else:
+                        step = old_step
+                        step.replay(env, fout)
+                        self.reused += 1
+                    if step.output is None:
+                        if step.value == old_step.value:
+                            dirty.discard(step.node.var_name)
+                        else:
+                            dirty.add(step.node.var_name)
+                    steps.append(step)
+
+        except (NameError, ValueError) as error:
+            raise _locate(error, code, numbers[index])
+
+        self.complete = True
+        return env
+
+    def _parse(self, code):
+        lines = {}
+        statements = []
+        numbers = []
+        for number, line in enumerate(code.splitlines(), 1):
+            parsed = lines.get(line, _MISSING)
+            if parsed is _MISSING:
+                parsed = self._lines.get(line, _MISSING)
+            if parsed is _MISSING:
+                try:
+                    tokens = tokenize_line(line)
+                    parsed = None
+                    if tokens:
+                        node = parse_statement(tokens)
+                        parsed = node, _reads(node)
+                except SyntaxError as error:
+                    raise _locate(error, code, number)
+                self.parsed += 1
+            lines[line] = parsed
+            if parsed is not None:
+                statements.append(parsed)
+                numbers.append(number)
+
+        # Keep only the lines of the latest version, so the cache does not
+        # grow with every edit.
+        self._lines = lines
+        return statements, numbers
+
+    def _execute(self, node, reads, env, fout):
+        self.executed += 1
+        if isinstance(node, PrintNode):
+            if node.value is None:
+                output = "\n"
+            else:
+                output = f"{evaluate_expr(node.value, env)}\n"
+            fout.write(output)
+            return Step(node, reads, output)
+
+        value = evaluate_expr(node.expr, env)
+        env[node.var_name] = value
+        return Step(node, reads, value=value)
+
+
+def _reads(node):
+    if isinstance(node, PrintNode):
+        return frozenset() if node.value is None else names_read(node.value)
+    return names_read(node.expr)
+
+
+def _locate(error, code, number):
+    # Statements are parsed line by line, so their positions are relative
+    # to the start of their line.
+    source_map = SourceMap.from_code(code)
+    pos = getattr(error, "pos", None)
+    if pos is not None and pos >= 0:
+        error.pos = source_map.line_starts[number - 1] + pos
+    return locate(error, source_map)
@@ -1,74 +1,422 @@
-from dataclasses import dataclass
+import re
+import sys
+from array import array
+from dataclasses import dataclass, field
 
 
-@dataclass
+@dataclass(slots=True)
 class Token:
     type: str
     value: str
+    pos: int = field(default=-1, compare=False, repr=False)
+
+
+KEYWORDS = {"print": "PRINT"}
+
+# Integer token kinds, used by the compact lexer output in place of the
+# type strings of Token.
+(NUMBER, IDENTIFIER, PRINT, LPAREN, RPAREN, PLUS, MINUS, MULTIPLY, DIVIDE,
+ EQUALS) = range(10)
+
+KIND_NAMES = (
+    "NUMBER", "IDENTIFIER", "PRINT", "LPAREN", "RPAREN", "PLUS", "MINUS",
+    "MULTIPLY", "DIVIDE", "EQUALS",
+)
+KINDS = {name: kind for kind, name in enumerate(KIND_NAMES)}
+_KEYWORD_KINDS = {word: KINDS[name] for word, name in KEYWORDS.items()}
+
+# The same line boundaries as str.splitlines().
+NEWLINE = r"\r\n|[\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]"
+
+_NEWLINE_PATTERN = re.compile(NEWLINE)
+
+_TOKEN_PATTERN = re.compile(
+    rf"""
+    (?P<NEWLINE>{NEWLINE})
+    | (?P<SKIP>[ \t]+)
+    | (?P<NUMBER>\d+)
+    | (?P<IDENTIFIER>[^\W\d_][^\W_]*)
+    | (?P<LPAREN>\()
+    | (?P<RPAREN>\))
+    | (?P<PLUS>\+)
+    | (?P<MINUS>-)
+    | (?P<MULTIPLY>\*)
+    | (?P<DIVIDE>/)
+    | (?P<EQUALS>=)
+    | (?P<MISMATCH>.)
+    """,
+    re.VERBOSE,
+)
+
+
+# The bytes lexer scans UTF-8 encoded source, for instance a memory-mapped
+# file, without decoding it. Positions are byte offsets. Only numbers and
+# identifiers are decoded; a word containing non-ASCII bytes is decoded on
+# its own and handed to the str lexer so both agree on what it means.
+BYTES_NEWLINE = rb"\r\n|[\n\r\v\f\x1c\x1d\x1e]|\xc2\x85|\xe2\x80[\xa8\xa9]"
+
+_NON_ASCII = rb"(?:(?!\xc2\x85|\xe2\x80[\xa8\xa9])[\x80-\xff])"
+
+_BYTES_TOKEN_PATTERN = re.compile(
+    rb"""
+    (?P<NEWLINE>""" + BYTES_NEWLINE + rb""")
+    | (?P<SKIP>[ \t]+)
+    | (?P<NUMBER>(?>[0-9]+)(?!""" + _NON_ASCII + rb"""))
+    | (?P<IDENTIFIER>(?>[A-Za-z][A-Za-z0-9]*)(?!""" + _NON_ASCII + rb"""))
+    | (?P<WORD>[0-9A-Za-z_]*""" + _NON_ASCII + rb"""(?:[0-9A-Za-z_]|"""
+    + _NON_ASCII + rb""")*)
+    | (?P<LPAREN>\()
+    | (?P<RPAREN>\))
+    | (?P<PLUS>\+)
+    | (?P<MINUS>-)
+    | (?P<MULTIPLY>\*)
+    | (?P<DIVIDE>/)
+    | (?P<EQUALS>=)
+    | (?P<MISMATCH>.)
+    """,
+    re.VERBOSE,
+)
+
+_SYMBOLS = {
+    "LPAREN": "(",
+    "RPAREN": ")",
+    "PLUS": "+",
+    "MINUS": "-",
+    "MULTIPLY": "*",
+    "DIVIDE": "/",
+    "EQUALS": "=",
+}
+
+# The Token lexer splits text into line breaks, symbols and words with a
+# pattern that has no groups, so a match costs only its text and offset.
+# A word is classified by looking it up, or with str.isdecimal() and
+# str.isalnum(), which agree with \d and \w. Anything else, such as "12a"
+# or a word holding a stray character, is relexed with _TOKEN_PATTERN,
+# which also reports errors.
+_LINE_BREAK_CHARS = "\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029"
+
+_WORD_PATTERN = re.compile(
+    rf"{NEWLINE}|[()+\-*/=]|[^ \t()+\-*/={_LINE_BREAK_CHARS}]+"
+)
+
+_WORD_KINDS = {
+    **{symbol: kind for kind, symbol in _SYMBOLS.items()},
+    **KEYWORDS,
+    "\r\n": "NEWLINE",
+    **{character: "NEWLINE" for character in _LINE_BREAK_CHARS},
+}
+
+
+class TokenStream:
+    # A whole program's tokens as parallel arrays: an integer kind, a value,
+    # a start offset and a length per token. Numbers are stored as ints,
+    # identifiers interned, and other tokens keep their text. lines holds
+    # the index of the first token of each non-blank line.
+    __slots__ = ("kinds", "values", "positions", "lengths", "lines",
+                 "source", "tokens")
+
+    def __init__(self, source=None):
+        self.kinds = array("B")
+        self.values = []
+        self.positions = array("q")
+        self.lengths = array("I")
+        self.lines = array("q")
+        self.source = source
+        self.tokens = None
+
+    @classmethod
+    def from_tokens(cls, tokens):
+        # A single line of Tokens, for the Token-based parser API. The
+        # Tokens are kept in place of lengths and source text.
+        stream = cls.__new__(cls)
+        stream.kinds = [KINDS[token.type] for token in tokens]
+        stream.values = [
+            int(token.value) if token.type == "NUMBER" else token.value
+            for token in tokens
+        ]
+        stream.positions = [token.pos for token in tokens]
+        stream.lengths = None
+        stream.lines = [0]
+        stream.source = None
+        stream.tokens = tokens
+        return stream
+
+    def line(self, index):
+        # The range of token indexes making up a line.
+        start = self.lines[index]
+        if index + 1 < len(self.lines):
+            return start, self.lines[index + 1]
+        return start, len(self.kinds)
+
+    def token(self, index):
+        if self.tokens is not None:
+            return self.tokens[index]
+        pos = self.positions[index]
+        if self.source is None:
+            value = str(self.values[index])
+        else:
+            value = self.source[pos:pos + self.lengths[index]]
+        return Token(KIND_NAMES[self.kinds[index]], value, pos)
+
+    def end(self, index):
+        # The offset just past a token.
+        if self.tokens is not None:
+            token = self.tokens[index]
+            return token.pos + len(token.value)
+        return self.positions[index] + self.lengths[index]
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __iter__(self):
+        # Token lists, one per line, as tokenize_program returns them.
+        for index in range(len(self.lines)):
+            start, stop = self.line(index)
+            yield [self.token(i) for i in range(start, stop)]
+
+    def __repr__(self):
+        return (
+            f"TokenStream({len(self.lines)} lines, {len(self.kinds)} tokens)"
+        )
+
+
+def line_starts(code):
+    starts = array("q", [0])
+    starts.extend(match.end() for match in _NEWLINE_PATTERN.finditer(code))
+    return starts
 
 
 def tokenize_program(code):
-    lines = code.splitlines()
-    return [tokenize_line(line) for line in lines if line.strip()]
+    return _tokenize(code)
+
+
+def _tokenize(text, offset=0):
+    # The token lists of the non-blank lines of text, with positions offset.
+    token_lines = []
+    tokens = []
+    append = tokens.append
+    kinds = _WORD_KINDS
+    line_start = 0
+
+    for match in _WORD_PATTERN.finditer(text):
+        word = match.group()
+        kind = kinds.get(word)
+
+        if kind is None:
+            if word.isdecimal():
+                kind = "NUMBER"
+            elif word.isalnum() and not word[0].isdecimal():
+                kind = "IDENTIFIER"
+            else:
+                tokens.extend(_relex(
+                    text, match.start(), match.end(), offset, line_start
+                ))
+                continue
+
+        elif kind == "NEWLINE":
+            if tokens:
+                token_lines.append(tokens)
+                tokens = []
+                append = tokens.append
+            line_start = match.end()
+            continue
 
+        append(Token(kind, word, offset + match.start()))
 
-def tokenize_line(line):
+    if tokens:
+        token_lines.append(tokens)
+
+    return token_lines
+
+
+def tokenize_stream(code):
+    stream = TokenStream(code)
+    add_kind = stream.kinds.append
+    add_value = stream.values.append
+    add_position = stream.positions.append
+    add_length = stream.lengths.append
+    add_line = stream.lines.append
+    positions = stream.positions
+    intern = sys.intern
+    keyword_kinds = _KEYWORD_KINDS
+    kinds = KINDS
+    symbols = _SYMBOLS
+    new_line = True
+    line_start = 0
+
+    for match in _TOKEN_PATTERN.finditer(code):
+        kind = match.lastgroup
+
+        if kind == "SKIP":
+            continue
+
+        elif kind == "NEWLINE":
+            new_line = True
+            line_start = match.end()
+            continue
+
+        elif kind == "IDENTIFIER":
+            value = intern(match.group())
+            add_kind(keyword_kinds.get(value, IDENTIFIER))
+            add_value(value)
+
+        elif kind == "NUMBER":
+            value = match.group()
+            add_kind(NUMBER)
+            add_value(int(value))
+
+        elif kind == "MISMATCH":
+            raise _unexpected_character(
+                match.group(), match.start() - line_start, match.start()
+            )
+
+        else:
+            value = symbols[kind]
+            add_kind(kinds[kind])
+            add_value(value)
+
+        if new_line:
+            add_line(len(positions))
+            new_line = False
+        add_position(match.start())
+        add_length(len(value))
+
+    return stream
+
+
+def tokenize_buffer(buffer):
     tokens = []
-    i = 0
+    line_start = 0
+
+    for match in _BYTES_TOKEN_PATTERN.finditer(buffer):
+        kind = match.lastgroup
+
+        if kind == "NEWLINE":
+            if tokens:
+                yield tokens
+                tokens = []
+            line_start = match.end()
 
-    while i < len(line):
-        c = line[i]
+        elif kind == "SKIP":
+            pass
 
-        if c in " \t\n":
-            i += 1
+        elif kind == "IDENTIFIER":
+            value = match.group().decode("ascii")
+            tokens.append(
+                Token(KEYWORDS.get(value, kind), value, match.start())
+            )
 
-        elif line[i:].startswith("print", i):
-            tokens.append(Token("PRINT", "print"))
-            i += 5
+        elif kind == "NUMBER":
+            tokens.append(
+                Token(kind, match.group().decode("ascii"), match.start())
+            )
 
-        elif c == "(":
-            tokens.append(Token("LPAREN", c))
-            i += 1
+        elif kind == "WORD":
+            tokens.extend(_tokenize_word(buffer, match, line_start))
 
-        elif c == ")":
-            tokens.append(Token("RPAREN", c))
-            i += 1
+        elif kind == "MISMATCH":
+            raise _unexpected_character(
+                match.group().decode("ascii"),
+                _column(buffer, line_start, match.start()),
+                match.start(),
+            )
+
+        else:
+            tokens.append(Token(kind, _SYMBOLS[kind], match.start()))
+
+    if tokens:
+        yield tokens
 
-        elif c == "+":
-            tokens.append(Token("PLUS", c))
-            i += 1
 
-        elif c == "-":
-            tokens.append(Token("MINUS", c))
-            i += 1
+def _tokenize_word(buffer, match, line_start):
+    start = match.start()
+    try:
+        word = match.group().decode()
+    except UnicodeDecodeError as error:
+        error = SyntaxError(f"Invalid UTF-8: {error.reason}")
+        error.pos = start
+        raise error from None
 
-        elif c == "*":
-            tokens.append(Token("MULTIPLY", c))
-            i += 1
+    def byte_offset(index):
+        return start + len(word[:index].encode())
+
+    try:
+        tokens = tokenize_line(word)
+    except SyntaxError as error:
+        pos = byte_offset(error.pos)
+        raise _unexpected_character(
+            word[error.pos], _column(buffer, line_start, pos), pos
+        ) from None
+    for token in tokens:
+        token.pos = byte_offset(token.pos)
+    return tokens
 
-        elif c == "/":
-            tokens.append(Token("DIVIDE", c))
-            i += 1
 
-        elif c == "=":
-            tokens.append(Token("EQUALS", c))
-            i += 1
+def _column(buffer, line_start, pos):
+    # The character position of a byte offset within its line.
+    return len(bytes(buffer[line_start:pos]).decode(errors="replace"))
 
-        elif c.isdigit():
-            start = i
-            while i < len(line) and line[i].isdigit():
-                i += 1
-            number = line[start:i]
-            tokens.append(Token("NUMBER", number))
 
-        elif c.isalpha():
-            start = i
-            while i < len(line) and line[i].isalnum():
-                i += 1
-            ident = line[start:i]
-            tokens.append(Token("IDENTIFIER", ident))
+def tokenize_lines(lines, source_map=None, offset=0):
+    for raw_line in lines:
+        # A line read from a file ends at "\n" but may hold other line
+        # breaks, which end lines in tokenize_program too.
+        for line in raw_line.splitlines(keepends=True):
+            if source_map is not None:
+                source_map.add_line(offset, line)
+            tokens = tokenize_line(line, offset)
+            if tokens:
+                yield tokens
+            offset += len(line)
+
+
+def tokenize_line(line, offset=0):
+    token_lines = _tokenize(line, offset)
+    if len(token_lines) > 1:
+        # The line break after the first line's tokens.
+        last = token_lines[0][-1]
+        match = _NEWLINE_PATTERN.search(
+            line, last.pos - offset + len(last.value)
+        )
+        raise _unexpected_line_break(match.start(), offset + match.start())
+    return token_lines[0] if token_lines else []
+
+
+def _relex(text, start, end, offset, line_start):
+    # Tokens in text[start:end], with positions offset and error columns
+    # counted from line_start.
+    tokens = []
+
+    for match in _TOKEN_PATTERN.finditer(text, start, end):
+        kind = match.lastgroup
+
+        if kind == "IDENTIFIER":
+            value = match.group()
+            tokens.append(
+                Token(KEYWORDS.get(value, kind), value, offset + match.start())
+            )
+
+        elif kind == "MISMATCH":
+            raise _unexpected_character(
+                match.group(), match.start() - line_start,
+                offset + match.start(),
+            )
 
         else:
-            raise SyntaxError(f"Unexpected character: '{c}' at position {i}")
+            tokens.append(Token(kind, match.group(), offset + match.start()))
 
     return tokens
+
+
+def _unexpected_character(character, position, pos):
+    error = SyntaxError(
+        f"Unexpected character: '{character}' at position {position}"
+    )
+    error.pos = pos
+    return error
+
+
+def _unexpected_line_break(position, pos):
+    error = SyntaxError(f"Unexpected line break at position {position}")
+    error.pos = pos
+    return error
@@ -1,11 +1,151 @@
-from .lexer import tokenize_program
-from .parser import parse_program
+import io
+import mmap
+import os
+import stat
+
+from .lexer import tokenize_stream, tokenize_lines, tokenize_buffer
+from .parser import parse_program, parse_statements
+from .nodes import ProgramNode
 from .evaluator import evaluate
+from .optimizer import fold_statements, eliminate_dead_stores
+from .output import OutputBuffer, DEFAULT_BUFFER_SIZE
+from .source import SourceMap, LineSourceMap, BufferSourceMap, locate
+from .budget import BudgetExceeded
+from .cache import program_key
+from .parallel import parse_parallel
+from . import compiler, cse, flat, scheduler, vm
+
+BACKENDS = {
+    "tree": evaluate,
+    "compiled": compiler.execute,
+    "flat": flat.execute,
+    "vm": vm.execute,
+    "cse": cse.execute,
+    "parallel": scheduler.execute,
+}
+
+# Backends that run each statement as soon as it has been parsed, so a
+# streamed statement's error is raised while its line is still current.
+STREAMING_BACKENDS = {"tree", "compiled", "cse"}
+
+
+def main(fin, fout, stream=False, backend="tree", optimize=False,
+         cache=None, buffer_size=None, mapped=False, env=None,
+         intern=False, budget=None, workers=None):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend}")
+    # The cse backend only finds shared values in an interned tree.
+    intern = intern or backend == "cse"
+    if stream and cache is not None:
+        raise ValueError("A program cache cannot be used in streaming mode")
+    if mapped and cache is not None:
+        raise ValueError("A program cache cannot be used with mapped input")
+    if intern and cache is not None:
+        # Cached programs are rebuilt without shared nodes.
+        raise ValueError(
+            "A program cache cannot be used with interning or the cse backend"
+        )
+    if budget is not None and backend != "tree":
+        raise ValueError("Budgets are only enforced by the tree backend")
+    if workers is not None and (stream or mapped or cache is not None
+                                or intern):
+        raise ValueError(
+            "Parallel parsing cannot be combined with streaming, mapped "
+            "input, a program cache or interning"
+        )
+
+    # Line numbers are only worked out once an error needs them. Streaming
+    # input is not kept: only the current line is remembered, unless the
+    # backend reads the whole program before running it, in which case
+    # every line start is.
+    code = None
+    buffer = None
+    token_lines = statements = None
+    if backend in STREAMING_BACKENDS:
+        source_map = LineSourceMap()
+    else:
+        source_map = SourceMap()
+    interner = cse.NodeInterner() if intern else None
+    try:
+        if mapped:
+            # fin is a file opened in binary mode. It is never read into
+            # memory as a whole: statements are lexed from the mapping,
+            # parsed and run one at a time.
+            buffer = _map_file(fin)
+            token_lines = tokenize_buffer(buffer)
+            statements = parse_statements(token_lines, interner)
+            program_node = ProgramNode(statements)
+        elif stream:
+            program_node = ProgramNode(
+                parse_statements(tokenize_lines(fin, source_map), interner)
+            )
+        elif cache is not None:
+            code = fin.read()
+            program_node = cache.get_program(code)
+        elif workers is not None:
+            code = fin.read()
+            program_node = parse_parallel(code, max_workers=workers)
+        else:
+            code = fin.read()
+            program_node = parse_program(tokenize_stream(code), interner)
+        if optimize:
+            program_node = ProgramNode(
+                fold_statements(program_node.statements)
+            )
+            # Liveness needs the whole program, so streamed input is only
+            # folded. A caller's env stays in use after the run, so its
+            # final values count as read.
+            if not (stream or mapped):
+                program_node, _ = eliminate_dead_stores(
+                    program_node, () if env is None else env,
+                    keep_final=env is not None,
+                )
+        if code is not None and not (optimize and env is not None):
+            # A program read whole is known by its text, so a backend can
+            # reuse what it compiled for an earlier run of it. Optimizing
+            # against a caller's env can give a different program.
+            program_node.key = (program_key(code), optimize)
+        if buffer_size is None:
+            # Streaming keeps output prompt by default; batch runs buffer it.
+            buffer_size = 0 if stream else DEFAULT_BUFFER_SIZE
+        execute = BACKENDS[backend] if budget is None else budget.evaluate
+        _run(program_node, fout, execute, buffer_size,
+             {} if env is None else env)
+    except (SyntaxError, NameError, ValueError, BudgetExceeded) as error:
+        if buffer is not None:
+            source_map = BufferSourceMap(buffer)
+        elif code is not None:
+            source_map = SourceMap.from_code(code)
+        raise locate(error, source_map)
+    finally:
+        if isinstance(buffer, mmap.mmap):
+            # A lexer stopped part way still holds a view of the mapping,
+            # which cannot be closed until the lexer is.
+            statements.close()
+            token_lines.close()
+            buffer.close()
+
+
+def _run(program_node, fout, execute, buffer_size, env):
+    if buffer_size:
+        with OutputBuffer(fout, buffer_size) as out:
+            execute(program_node, env, out)
+    else:
+        execute(program_node, env, fout)
 
 
-def main(fin, fout):
-    code = fin.getvalue()
-    token_lines = tokenize_program(code)
-    program_node = parse_program(token_lines)
-    env = {}
-    evaluate(program_node, env, fout)
+def _map_file(fin):
+    # Only regular files can be mapped. Other input, such as a pipe or an
+    # in-memory stream, is read whole and encoded as UTF-8 if it is text,
+    # since the lexer works on bytes.
+    try:
+        fileno = fin.fileno()
+    except (AttributeError, io.UnsupportedOperation):
+        fileno = None
+    if fileno is None or not stat.S_ISREG(os.fstat(fileno).st_mode):
+        data = fin.read()
+        return data.encode() if isinstance(data, str) else data
+    if os.fstat(fileno).st_size == 0:
+        # Empty files cannot be mapped.
+        return b""
+    return mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
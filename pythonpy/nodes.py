@@ -1,14 +1,28 @@
+# Every node but ProgramNode carries `pos`, the offset in the source text
+# where it starts (for BinOpNode, the offset of its operator). Positions
+# are not part of node equality.
+
+
 class ProgramNode:
-    def __init__(self, statements):
+    # key, if set, identifies the program: programs with equal keys are
+    # equal, so a backend may reuse code compiled for one to run another.
+    __slots__ = ("statements", "source_map", "key")
+
+    def __init__(self, statements, source_map=None, key=None):
         self.statements = statements
+        self.source_map = source_map
+        self.key = key
 
     def __repr__(self):
         return f"ProgramNode({len(self.statements)} statements)"
 
 
 class PrintNode:
-    def __init__(self, value=None):
+    __slots__ = ("value", "pos")
+
+    def __init__(self, value=None, pos=None):
         self.value = value
+        self.pos = pos
 
     def __eq__(self, other):
         return isinstance(other, PrintNode) and self.value == other.value
@@ -18,10 +32,13 @@ class PrintNode:
 
 
 class BinOpNode:
-    def __init__(self, left, op, right):
+    __slots__ = ("left", "op", "right", "pos")
+
+    def __init__(self, left, op, right, pos=None):
         self.left = left
         self.op = op
         self.right = right
+        self.pos = pos
 
     def __eq__(self, other):
         return (
@@ -36,9 +53,12 @@ class BinOpNode:
 
 
 class AssignNode:
-    def __init__(self, var_name, expr):
+    __slots__ = ("var_name", "expr", "pos")
+
+    def __init__(self, var_name, expr, pos=None):
         self.var_name = var_name
         self.expr = expr
+        self.pos = pos
 
     def __eq__(self, other):
         return (
@@ -52,8 +72,11 @@ class AssignNode:
 
 
 class NameNode:
-    def __init__(self, var_name):
+    __slots__ = ("var_name", "pos")
+
+    def __init__(self, var_name, pos=None):
         self.var_name = var_name
+        self.pos = pos
 
     def __eq__(self, other):
         return (
@@ -0,0 +1,191 @@
+from .nodes import ProgramNode, PrintNode, BinOpNode, AssignNode, NameNode
+from .symbols import names_read
+
+_FOLD = object()
+
+
+def fold_constants(node):
+    statements = []
+    eliminated = 0
+    for statement in node.statements:
+        statement, count = fold_statement(statement)
+        statements.append(statement)
+        eliminated += count
+
+    return ProgramNode(statements), eliminated
+
+
+def fold_statements(statements):
+    for statement in statements:
+        yield fold_statement(statement)[0]
+
+
+def fold_statement(node):
+    if isinstance(node, PrintNode) and node.value is not None:
+        value = fold_expr(node.value)
+        if value is not node.value:
+            eliminated = count_nodes(node.value) - count_nodes(value)
+            return PrintNode(value, node.pos), eliminated
+
+    elif isinstance(node, AssignNode):
+        expr = fold_expr(node.expr)
+        if expr is not node.expr:
+            eliminated = count_nodes(node.expr) - count_nodes(expr)
+            return AssignNode(node.var_name, expr, node.pos), eliminated
+
+    return node, 0
+
+
+def fold_expr(expr):
+    if not isinstance(expr, BinOpNode):
+        return expr
+
+    # Postorder rebuild with explicit stacks so deep trees do not hit the
+    # recursion limit.
+    stack = [expr]
+    values = []
+    pending = []
+
+    while stack:
+        item = stack.pop()
+        if item is _FOLD:
+            right = values.pop()
+            left = values.pop()
+            values.append(_fold_binop(pending.pop(), left, right))
+        elif isinstance(item, BinOpNode):
+            pending.append(item)
+            stack.append(_FOLD)
+            stack.append(item.right)
+            stack.append(item.left)
+        else:
+            values.append(item)
+
+    return values[0]
+
+
+def _fold_binop(expr, left, right):
+    op = expr.op
+
+    if isinstance(left, int) and isinstance(right, int):
+        if op == "+":
+            return left + right
+        elif op == "-":
+            return left - right
+        elif op == "*":
+            return left * right
+        elif op == "/" and right != 0:
+            return left // right
+
+    elif op == "+":
+        if _is_constant(left, 0):
+            return right
+        if _is_constant(right, 0):
+            return left
+
+    elif op == "-":
+        if _is_constant(right, 0):
+            return left
+
+    elif op == "*":
+        if _is_constant(right, 1):
+            return left
+        if _is_constant(left, 1):
+            return right
+        # Dropping the other operand must not hide a NameError/ValueError.
+        if _is_constant(left, 0) and cannot_raise(right):
+            return 0
+        if _is_constant(right, 0) and cannot_raise(left):
+            return 0
+
+    elif op == "/":
+        if _is_constant(right, 1):
+            return left
+
+    if left is expr.left and right is expr.right:
+        return expr
+    return BinOpNode(left, op, right, expr.pos)
+
+
+def eliminate_dead_stores(node, defined=(), keep_final=False):
+    # Drops assignments whose value is never read: those overwritten before
+    # any read, and those never read at all unless keep_final says the
+    # environment is still used once the program ends. Assignments that may
+    # raise are kept so errors and the output before them are unchanged.
+    statements = list(node.statements)
+
+    # Forward pass: whether each assignment is safe to drop. Every
+    # statement before it has completed, so all of their targets are bound.
+    defined = set(defined)
+    safe = []
+    for statement in statements:
+        if isinstance(statement, AssignNode):
+            safe.append(cannot_raise(statement.expr, defined))
+            defined.add(statement.var_name)
+        else:
+            safe.append(False)
+
+    # Backward pass over live variables: names that may be read before
+    # they are next assigned.
+    live = set()
+    overwritten = set()
+    kept = []
+    for statement, can_drop in zip(reversed(statements), reversed(safe)):
+        if isinstance(statement, PrintNode):
+            if statement.value is not None:
+                live.update(names_read(statement.value))
+        elif isinstance(statement, AssignNode):
+            name = statement.var_name
+            observed = name in live or (
+                keep_final and name not in overwritten
+            )
+            overwritten.add(name)
+            if not observed and can_drop:
+                continue
+            live.discard(name)
+            live.update(names_read(statement.expr))
+        kept.append(statement)
+
+    kept.reverse()
+    return ProgramNode(kept, node.source_map), len(statements) - len(kept)
+
+
+def _is_constant(expr, value):
+    return isinstance(expr, int) and expr == value
+
+
+def cannot_raise(expr, defined=()):
+    # Names in `defined` are known to be bound, so reading them cannot
+    # raise NameError.
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, int):
+            continue
+        elif isinstance(node, NameNode):
+            if node.var_name not in defined:
+                return False
+            continue
+        elif not isinstance(node, BinOpNode):
+            return False
+        elif node.op == "/":
+            if not isinstance(node.right, int) or node.right == 0:
+                return False
+        elif node.op not in ("+", "-", "*"):
+            return False
+        stack.append(node.left)
+        stack.append(node.right)
+
+    return True
+
+
+def count_nodes(expr):
+    count = 0
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        count += 1
+        if isinstance(node, BinOpNode):
+            stack.append(node.left)
+            stack.append(node.right)
+
+    return count
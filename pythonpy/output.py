@@ -0,0 +1,31 @@
+DEFAULT_BUFFER_SIZE = 64 * 1024
+
+
+class OutputBuffer:
+    __slots__ = ("fout", "buffer_size", "_chunks", "_size")
+
+    def __init__(self, fout, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.fout = fout
+        self.buffer_size = buffer_size
+        self._chunks = []
+        self._size = 0
+
+    def write(self, text):
+        self._chunks.append(text)
+        self._size += len(text)
+        if self._size >= self.buffer_size:
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        if self._chunks:
+            self.fout.write("".join(self._chunks))
+            self._chunks.clear()
+            self._size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Always flush, so output produced before an error is not lost.
+        self.flush()
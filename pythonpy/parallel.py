@@ -0,0 +1,82 @@
+import os
+import re
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from .flat import flatten, unflatten, NO_POSITION
+from .lexer import tokenize_stream, NEWLINE
+from .nodes import ProgramNode
+from .parser import parse_program
+
+# Lines are lexed and parsed independently, so a large program can be split
+# at line boundaries and its chunks parsed in worker processes. Each worker
+# sends back its chunk's flat encoding, which pickles as a few arrays
+# rather than a graph of node objects, and the parent rebuilds the nodes
+# in program order.
+
+# Programs smaller than this are parsed in-process; starting workers and
+# shipping source to them would cost more than it saves.
+MIN_PARALLEL_SIZE = 1 << 20
+
+# Chunks handed out per worker, so uneven chunks balance out.
+CHUNKS_PER_WORKER = 4
+
+_NEWLINE_PATTERN = re.compile(NEWLINE)
+
+
+def split_chunks(code, chunks):
+    # Returns (offset, text) pairs covering code, each ending just after a
+    # line break, except possibly the last.
+    result = []
+    start = 0
+    for i in range(1, chunks):
+        target = max(start, len(code) * i // chunks)
+        match = _NEWLINE_PATTERN.search(code, target)
+        if match is None:
+            break
+        end = match.end()
+        if end > start:
+            result.append((start, code[start:end]))
+            start = end
+    if start < len(code) or not result:
+        result.append((start, code[start:]))
+    return result
+
+
+def parse_chunk(offset, text):
+    try:
+        program = flatten(parse_program(tokenize_stream(text)))
+    except SyntaxError as error:
+        pos = getattr(error, "pos", None)
+        if pos is not None and pos >= 0:
+            error.pos = pos + offset
+        raise
+    program.positions = array("q", (
+        pos if pos == NO_POSITION else pos + offset
+        for pos in program.positions
+    ))
+    return program
+
+
+def parse_parallel(code, executor=None, max_workers=None, chunks=None):
+    if executor is None and len(code) < MIN_PARALLEL_SIZE:
+        return parse_program(tokenize_stream(code))
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if chunks is None:
+        chunks = max_workers * CHUNKS_PER_WORKER
+    offsets, texts = zip(*split_chunks(code, chunks))
+
+    if executor is None:
+        with ProcessPoolExecutor(max_workers) as executor:
+            programs = list(executor.map(parse_chunk, offsets, texts))
+    else:
+        programs = list(executor.map(parse_chunk, offsets, texts))
+
+    # Results come back in chunk order, so the first error raised is the
+    # first in the program.
+    statements = []
+    for program in programs:
+        statements.extend(unflatten(program).statements)
+    return ProgramNode(statements)
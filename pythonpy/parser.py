@@ -1,40 +1,70 @@
+from .lexer import (
+    TokenStream, KIND_NAMES, NUMBER, IDENTIFIER, PRINT, LPAREN, RPAREN,
+    EQUALS,
+)
 from .nodes import ProgramNode, PrintNode, BinOpNode, AssignNode, NameNode
+from .source import set_position
 
+ADDITIVE, MULTIPLICATIVE, PRIMARY = range(1, 4)
 
-def parse_program(token_lines):
-    statements = []
-    for tokens in token_lines:
-        statement = parse_statement(tokens)
-        statements.append(statement)
+PRECEDENCE = {
+    "PLUS": ADDITIVE,
+    "MINUS": ADDITIVE,
+    "MULTIPLY": MULTIPLICATIVE,
+    "DIVIDE": MULTIPLICATIVE,
+}
 
-    return ProgramNode(statements)
+# PRECEDENCE indexed by integer token kind.
+_PRECEDENCE = tuple(PRECEDENCE.get(name) for name in KIND_NAMES)
 
+_LPAREN = object()
 
-def parse_statement(tokens):
+# The parser works on a TokenStream. The functions taking lists of Tokens
+# wrap a single line in a stream and parse that.
+
+
+def parse_program(token_lines, interner=None):
+    return ProgramNode(list(parse_statements(token_lines, interner)))
+
+
+def parse_statements(token_lines, interner=None):
+    if isinstance(token_lines, TokenStream):
+        for index in range(len(token_lines)):
+            start, stop = token_lines.line(index)
+            yield _parse_statement(token_lines, start, stop, interner)
+    else:
+        for tokens in token_lines:
+            yield parse_statement(tokens, interner)
+
+
+def parse_statement(tokens, interner=None):
+    stream = TokenStream.from_tokens(tokens)
+    return _parse_statement(stream, 0, len(tokens), interner)
+
+
+def _parse_statement(stream, start, stop, interner):
+    kinds = stream.kinds
     if (
-        len(tokens) == 3
-        and tokens[0].type == "PRINT"
-        and tokens[1].type == "LPAREN"
-        and tokens[2].type == "RPAREN"
+        stop - start >= 3
+        and kinds[start] == PRINT
+        and kinds[start + 1] == LPAREN
+        and kinds[stop - 1] == RPAREN
     ):
-        return PrintNode()
+        if stop - start == 3:
+            return PrintNode(pos=stream.positions[start])
+        expr = _parse_expr(stream, start + 2, stop - 1, interner)
+        return PrintNode(expr, stream.positions[start])
     elif (
-        tokens[0].type == "PRINT"
-        and tokens[1].type == "LPAREN"
-        and tokens[-1].type == "RPAREN"
+        stop - start >= 3
+        and kinds[start] == IDENTIFIER
+        and kinds[start + 1] == EQUALS
     ):
-        inner_tokens = tokens[2:-1]
-        expr = parse_expr_wrapper(inner_tokens)
-        return PrintNode(expr)
-    elif (
-        3 <= len(tokens) and
-        tokens[0].type == "IDENTIFIER" and
-        tokens[1].type == "EQUALS"
-    ):
-        expr = parse_expr_wrapper(tokens[2:])
-        return AssignNode(tokens[0].value, expr)
+        expr = _parse_expr(stream, start + 2, stop, interner)
+        return AssignNode(stream.values[start], expr, stream.positions[start])
     else:
-        raise SyntaxError("Failed to parse")
+        raise set_position(
+            SyntaxError("Failed to parse"), stream.positions[start]
+        )
 
 
 def parse_atom(token):
@@ -44,54 +74,121 @@ def parse_atom(token):
         raise SyntaxError("Expected a number")
 
 
-def parse_expr_wrapper(tokens):
-    node, i = parse_expr(tokens, 0)
+def parse_expr_wrapper(tokens, interner=None):
+    node, i = parse_expr(tokens, 0, interner)
     return node
 
 
-def parse_expr(tokens, index):
+def parse_expr(tokens, index, interner=None):
     if not tokens:
         raise SyntaxError("Empty expression")
 
-    node, i = parse_term(tokens, index)
-    while i < len(tokens):
-        if tokens[i].type not in ("PLUS", "MINUS"):
-            break
-
-        op = tokens[i].value
-        right, i = parse_term(tokens, i+1)
-        node = BinOpNode(node, op, right)
+    stream = TokenStream.from_tokens(tokens)
+    return _parse_binary(stream, index, len(tokens), ADDITIVE, interner)
 
-    return node, i
 
+def _parse_expr(stream, start, stop, interner):
+    if start == stop:
+        raise SyntaxError("Empty expression")
 
-def parse_factor(tokens, i):
-    if len(tokens) <= i:
-        raise SyntaxError("Expected number or '('")
-
-    token = tokens[i]
-
-    if token.type == "NUMBER":
-        return int(token.value), i+1
-
-    elif token.type == "IDENTIFIER":
-        return NameNode(token.value), i+1
+    node, i = _parse_binary(stream, start, stop, ADDITIVE, interner)
+    return node
 
-    elif token.type == "LPAREN":
-        expr, next_i = parse_expr(tokens, i+1)
-        if len(tokens) <= next_i or tokens[next_i].type != "RPAREN":
-            raise SyntaxError("Expected ')'")
-        return expr, next_i + 1
 
-    raise SyntaxError(f"Unexpected token in factor: {token}")
+def parse_factor(tokens, i):
+    stream = TokenStream.from_tokens(tokens)
+    return _parse_binary(stream, i, len(tokens), PRIMARY)
 
 
 def parse_term(tokens, index):
-    node, i = parse_factor(tokens, index)
-
-    while i < len(tokens) and tokens[i].type in ["MULTIPLY", "DIVIDE"]:
-        op = tokens[i].value
-        right, i = parse_factor(tokens, i + 1)
-        node = BinOpNode(node, op, right)
-
-    return node, i
+    stream = TokenStream.from_tokens(tokens)
+    return _parse_binary(stream, index, len(tokens), MULTIPLICATIVE)
+
+
+def _parse_binary(stream, i, stop, min_precedence, interner=None):
+    # Operator precedence parsing with explicit operand and operator stacks,
+    # so nesting depth is bounded by memory rather than the recursion limit.
+    # Tokens from i up to stop are parsed. At the outermost level only
+    # operators binding at least as tightly as min_precedence are consumed;
+    # inside parentheses every operator is. An interner, when given, builds
+    # the nodes so that structurally identical subtrees are shared.
+    if interner is None:
+        binop, name = BinOpNode, NameNode
+    else:
+        binop, name = interner.binop, interner.name
+    kinds = stream.kinds
+    values = stream.values
+    positions = stream.positions
+    operands = []
+    operators = []
+    depth = 0
+
+    def reduce(precedence):
+        while operators and operators[-1] is not _LPAREN:
+            if operators[-1][0] < precedence:
+                break
+            _, op, pos = operators.pop()
+            right = operands.pop()
+            operands[-1] = binop(operands[-1], op, right, pos)
+
+    while True:
+        if stop <= i:
+            raise set_position(
+                SyntaxError("Expected number or '('"), _end(stream, stop)
+            )
+
+        kind = kinds[i]
+        i += 1
+
+        if kind == NUMBER:
+            operands.append(values[i - 1])
+
+        elif kind == IDENTIFIER:
+            operands.append(name(values[i - 1], positions[i - 1]))
+
+        elif kind == LPAREN:
+            operators.append(_LPAREN)
+            depth += 1
+            continue
+
+        else:
+            raise set_position(
+                SyntaxError(
+                    f"Unexpected token in factor: {stream.token(i - 1)}"
+                ),
+                positions[i - 1],
+            )
+
+        while True:
+            kind = kinds[i] if i < stop else None
+            precedence = None if kind is None else _PRECEDENCE[kind]
+
+            if precedence is not None and (
+                depth or min_precedence <= precedence
+            ):
+                reduce(precedence)
+                operators.append((precedence, values[i], positions[i]))
+                i += 1
+                break
+
+            elif depth and kind == RPAREN:
+                reduce(ADDITIVE)
+                operators.pop()
+                depth -= 1
+                i += 1
+
+            elif depth:
+                pos = _end(stream, stop) if kind is None else positions[i]
+                raise set_position(SyntaxError("Expected ')'"), pos)
+
+            else:
+                reduce(ADDITIVE)
+                return operands[0], i
+
+
+def _end(stream, stop):
+    # The position just past the token before stop, where a missing token
+    # belongs.
+    if not stop or stream.positions[stop - 1] < 0:
+        return None
+    return stream.end(stop - 1)
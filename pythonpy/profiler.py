@@ -0,0 +1,132 @@
+import time
+from collections import Counter
+
+from .evaluator import evaluate, OPERATORS
+from .lexer import tokenize_line
+from .parser import parse_statement
+from .nodes import ProgramNode
+
+# Instrumentation lives entirely in this module: the plain evaluator and
+# backends carry no profiling checks, so there is no cost unless a
+# Profiler is used.
+
+
+class StatementStats:
+    __slots__ = ("line", "source", "count", "time")
+
+    def __init__(self, line, source=None):
+        self.line = line
+        self.source = source
+        self.count = 0
+        self.time = 0.0
+
+    def __repr__(self):
+        return (
+            f"StatementStats(line={self.line}, count={self.count}, "
+            f"time={self.time:.6f})"
+        )
+
+
+class _CountingEnv(dict):
+    __slots__ = ("reads", "writes")
+
+    def __init__(self, env, reads, writes):
+        super().__init__(env)
+        self.reads = reads
+        self.writes = writes
+
+    def __getitem__(self, name):
+        self.reads[name] += 1
+        return super().__getitem__(name)
+
+    def __setitem__(self, name, value):
+        self.writes[name] += 1
+        super().__setitem__(name, value)
+
+
+class Profiler:
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.statements = {}
+        self.operator_counts = Counter()
+        self.reads = Counter()
+        self.writes = Counter()
+        self._operators = {
+            op: self._counted(op, function)
+            for op, function in OPERATORS.items()
+        }
+
+    def _counted(self, op, function):
+        counts = self.operator_counts
+
+        def run(left, right):
+            counts[op] += 1
+            return function(left, right)
+
+        return run
+
+    def run(self, code, fout, env=None):
+        statements = []
+        lines = []
+        sources = []
+        for number, line in enumerate(code.splitlines(), 1):
+            tokens = tokenize_line(line)
+            if tokens:
+                statements.append(parse_statement(tokens))
+                lines.append(number)
+                sources.append(line.strip())
+
+        self.evaluate(ProgramNode(statements), {} if env is None else env,
+                      fout, lines, sources)
+
+    def evaluate(self, node, env, fout, lines=None, sources=None):
+        clock = self.clock
+        counting_env = _CountingEnv(env, self.reads, self.writes)
+
+        try:
+            for index, statement in enumerate(node.statements):
+                line = lines[index] if lines else index + 1
+                stats = self.statements.get(line)
+                if stats is None:
+                    source = sources[index] if sources else None
+                    stats = self.statements[line] = StatementStats(
+                        line, source
+                    )
+
+                start = clock()
+                try:
+                    evaluate(statement, counting_env, fout, self._operators)
+                finally:
+                    stats.time += clock() - start
+                    stats.count += 1
+        finally:
+            env.update(counting_env)
+
+    def report(self, limit=20):
+        statements = sorted(
+            self.statements.values(), key=lambda s: s.time, reverse=True
+        )
+        out = [
+            "Statements by cumulative time:",
+            f"{'line':>8} {'count':>8} {'total ms':>10} {'per call us':>12}",
+        ]
+        for stats in statements[:limit]:
+            per_call = stats.time / stats.count * 1e6 if stats.count else 0.0
+            source = f"  {stats.source}" if stats.source else ""
+            out.append(
+                f"{stats.line:>8} {stats.count:>8} {stats.time * 1e3:>10.3f} "
+                f"{per_call:>12.2f}{source}"
+            )
+
+        out.append("Operators:")
+        for op, count in self.operator_counts.most_common():
+            out.append(f"{op:>8} {count:>8}")
+
+        out.append("Variables:")
+        out.append(f"{'name':>8} {'reads':>8} {'writes':>8}")
+        for name in sorted(set(self.reads) | set(self.writes)):
+            out.append(
+                f"{name:>8} {self.reads[name]:>8} {self.writes[name]:>8}"
+            )
+
+        return "\n".join(out)
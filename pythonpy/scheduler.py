@@ -0,0 +1,199 @@
+import heapq
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from .evaluator import evaluate_expr
+from .flat import flatten, evaluate_flat
+from .nodes import ProgramNode, PrintNode, AssignNode
+from .source import set_position
+from .symbols import names_read
+
+# Statements run as soon as the values they read are known, so independent
+# ones overlap on a process pool, while their effects are committed in
+# program order: output is written, and names assigned, exactly as the
+# sequential evaluator would, and the first statement to fail in program
+# order is the one whose error is raised.
+#
+# Each statement depends only on the statements that last assigned the
+# names it reads. Values are ints and never change, so a statement is
+# handed the values themselves and a later assignment to the same name
+# cannot affect it.
+
+# Statements reading only values smaller than this are evaluated in
+# process; shipping them to a worker would cost more than running them.
+INLINE_BITS = 1 << 12
+
+# Workers assign the result to this name, which no program can use since
+# identifiers cannot contain underscores.
+_RESULT = "_result"
+
+
+def dependencies(statements):
+    # For each statement, maps every name it reads to the index of the
+    # statement that last assigned it, or to None when it comes from the
+    # environment.
+    writers = {}
+    sources = []
+    for index, statement in enumerate(statements):
+        expr = _expr(statement)
+        reads = () if expr is None else names_read(expr)
+        sources.append({name: writers.get(name) for name in reads})
+        if isinstance(statement, AssignNode):
+            writers[statement.var_name] = index
+    return sources
+
+
+def evaluate_parallel(node, env, fout, executor=None, max_workers=None,
+                      inline_bits=INLINE_BITS):
+    if not isinstance(node, ProgramNode):
+        raise TypeError("Unknown node type")
+
+    # Dependencies are found over the whole program, so streamed
+    # statements are all read before any of them runs.
+    statements = list(node.statements)
+    if executor is None:
+        with ProcessPoolExecutor(max_workers) as executor:
+            _Scheduler(statements, env, fout, executor, inline_bits).run()
+    else:
+        _Scheduler(statements, env, fout, executor, inline_bits).run()
+
+
+class _Scheduler:
+    def __init__(self, statements, env, fout, executor, inline_bits):
+        self.statements = statements
+        self.env = env
+        self.fout = fout
+        self.executor = executor
+        self.inline_bits = inline_bits
+        self.sources = dependencies(statements)
+        self.results = {}
+        self.errors = {}
+        self.running = {}
+        self.ready = []
+        # Unfinished statements each statement waits for, and for each
+        # statement the ones waiting on it.
+        self.waiting = []
+        self.dependents = [[] for _ in statements]
+        # Dependents not yet started; a result is dropped once it has been
+        # committed and no dependent still needs it.
+        self.uses = [0] * len(statements)
+        for index, sources in enumerate(self.sources):
+            writers = {w for w in sources.values() if w is not None}
+            self.waiting.append(len(writers))
+            for writer in writers:
+                self.dependents[writer].append(index)
+                self.uses[writer] += 1
+            if not writers:
+                self.ready.append(index)
+        self.committed = 0
+        # The earliest statement known to fail; nothing after it is started.
+        self.failed = len(statements)
+
+    def run(self):
+        try:
+            while self.committed < len(self.statements):
+                # Earlier statements first, so output can be committed
+                # as early as possible.
+                while self.ready and self.ready[0] < self.failed:
+                    self._start(heapq.heappop(self.ready))
+                self._commit()
+                if self.running and self.committed < len(self.statements):
+                    done, _ = wait(self.running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        index = self.running.pop(future)
+                        try:
+                            self._finish(index, future.result())
+                        except (NameError, ValueError) as error:
+                            self._fail(index, error)
+        finally:
+            for future in self.running:
+                future.cancel()
+
+    def _start(self, index):
+        statement = self.statements[index]
+        expr = _expr(statement)
+        if expr is None:
+            self._finish(index, "\n")
+            return
+
+        values = {}
+        for name, writer in self.sources[index].items():
+            if writer is None:
+                if name in self.env:
+                    values[name] = self.env[name]
+            else:
+                values[name] = self.results[writer]
+                self._release(writer)
+
+        printed = isinstance(statement, PrintNode)
+        if all(
+            value.bit_length() < self.inline_bits
+            for value in values.values()
+        ):
+            try:
+                value = evaluate_expr(expr, values)
+                self._finish(index, f"{value}\n" if printed else value)
+            except (NameError, ValueError) as error:
+                self._fail(index, error)
+        else:
+            program = flatten(
+                ProgramNode([AssignNode(_RESULT, expr, statement.pos)])
+            )
+            future = self.executor.submit(
+                _evaluate_flat, program, values, printed
+            )
+            self.running[future] = index
+
+    def _finish(self, index, result):
+        self.results[index] = result
+        for dependent in self.dependents[index]:
+            self.waiting[dependent] -= 1
+            if not self.waiting[dependent]:
+                heapq.heappush(self.ready, dependent)
+
+    def _fail(self, index, error):
+        self.errors[index] = error
+        self.failed = min(self.failed, index)
+
+    def _commit(self):
+        statements = self.statements
+        results = self.results
+        while self.committed < len(statements):
+            index = self.committed
+            if index in self.errors:
+                raise set_position(
+                    self.errors[index], statements[index].pos
+                )
+            if index not in results:
+                return
+            statement = statements[index]
+            if isinstance(statement, PrintNode):
+                self.fout.write(results.pop(index))
+            else:
+                self.env[statement.var_name] = results[index]
+                if not self.uses[index]:
+                    del results[index]
+            self.committed += 1
+
+    def _release(self, writer):
+        self.uses[writer] -= 1
+        if not self.uses[writer] and writer < self.committed:
+            del self.results[writer]
+
+
+def _evaluate_flat(program, values, printed):
+    env = dict(values)
+    evaluate_flat(program, env, None)
+    value = env[_RESULT]
+    return f"{value}\n" if printed else value
+
+
+def _expr(statement):
+    if isinstance(statement, PrintNode):
+        return statement.value
+    elif isinstance(statement, AssignNode):
+        return statement.expr
+    raise TypeError("Unknown node type")
+
+
+def execute(node, env, fout):
+    evaluate_parallel(node, env, fout)
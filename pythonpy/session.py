@@ -0,0 +1,182 @@
+import argparse
+import asyncio
+import io
+import json
+import sys
+import time
+
+from .main import main
+
+# A long-lived process serving programs against a persistent environment,
+# so clients pay neither process startup nor imports per program.
+#
+# The protocol is JSON lines in both directions. Each request is one of
+#
+#   {"id": 1, "code": "x = 1\nprint(x)"}
+#   {"id": 2, "op": "stats"}
+#   {"id": 3, "op": "reset"}
+#
+# and is answered by exactly one response carrying the same "id". A run
+# answers with its "output" and an "error", which is null or an object with
+# the error "type", "message" and, when known, "line" and "column".
+# Requests may be pipelined: they are answered in order, and a client can
+# send any number of them before reading the responses.
+
+
+class SessionStats:
+    __slots__ = ("requests", "programs", "errors", "time", "output_bytes")
+
+    def __init__(self):
+        self.requests = 0
+        self.programs = 0
+        self.errors = 0
+        self.time = 0.0
+        self.output_bytes = 0
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return f"SessionStats({self.to_dict()})"
+
+
+class Session:
+    def __init__(self, **options):
+        self.options = options
+        self.env = {}
+        self.stats = SessionStats()
+
+    def run(self, code):
+        # Statements before a failing one keep their effect on the
+        # environment, as they would in a single run of the program.
+        fout = io.StringIO()
+        start = time.perf_counter()
+        try:
+            main(io.StringIO(code), fout, env=self.env, **self.options)
+            error = None
+        except Exception as e:
+            error = e
+            self.stats.errors += 1
+        self.stats.programs += 1
+        self.stats.time += time.perf_counter() - start
+        output = fout.getvalue()
+        self.stats.output_bytes += len(output)
+        return output, error
+
+    def reset(self):
+        self.env = {}
+
+    def handle(self, line):
+        self.stats.requests += 1
+        try:
+            request = json.loads(line)
+        except ValueError as error:
+            return self._protocol_error(None, f"Invalid JSON: {error}")
+        if not isinstance(request, dict):
+            return self._protocol_error(None, "A request must be an object")
+
+        request_id = request.get("id")
+        op = request.get("op", "run")
+        if op == "run":
+            code = request.get("code")
+            if not isinstance(code, str):
+                return self._protocol_error(
+                    request_id, "A run request needs a code string"
+                )
+            output, error = self.run(code)
+            return {
+                "id": request_id,
+                "output": output,
+                "error": None if error is None else _error_object(error),
+            }
+        elif op == "stats":
+            stats = {**self.stats.to_dict(), "variables": len(self.env)}
+            return {"id": request_id, "stats": stats}
+        elif op == "reset":
+            self.reset()
+            return {"id": request_id}
+        else:
+            return self._protocol_error(request_id, f"Unknown op: {op}")
+
+    def _protocol_error(self, request_id, message):
+        self.stats.errors += 1
+        return {
+            "id": request_id,
+            "error": {"type": "ProtocolError", "message": message},
+        }
+
+
+def _error_object(error):
+    if isinstance(error, SyntaxError):
+        message = error.msg
+    else:
+        message = str(error.args[0]) if error.args else ""
+    result = {"type": type(error).__name__, "message": message}
+    # Set by main() when the error's position in the program is known.
+    if getattr(error, "lineno", None) is not None:
+        result["line"] = error.lineno
+        result["column"] = error.offset
+    return result
+
+
+def serve(fin, fout, **options):
+    session = Session(**options)
+    for line in fin:
+        if line.strip():
+            fout.write(json.dumps(session.handle(line)) + "\n")
+            fout.flush()
+    return session
+
+
+async def serve_connection(reader, writer, executor=None, **options):
+    # Programs run in the executor (the loop's default thread pool if none
+    # is given), so a long program does not hold up the event loop and
+    # with it every other connection. Each connection still handles its
+    # own requests one at a time, in order.
+    #
+    # Responses are written without waiting for the client to read them;
+    # drain() only blocks once the transport's buffer is full, so pipelined
+    # requests are answered back to back.
+    loop = asyncio.get_running_loop()
+    session = Session(**options)
+    try:
+        async for line in reader:
+            if line.strip():
+                response = await loop.run_in_executor(
+                    executor, session.handle, line.decode()
+                )
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def serve_unix(path, executor=None, **options):
+    # Each connection gets its own session and environment, kept for as
+    # long as the connection stays open.
+    async def handle(reader, writer):
+        await serve_connection(reader, writer, executor, **options)
+
+    server = await asyncio.start_unix_server(handle, path)
+    async with server:
+        await server.serve_forever()
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pythonpy.session")
+    parser.add_argument("--socket", help="serve on this Unix socket path "
+                        "instead of stdin and stdout")
+    parser.add_argument("--backend", default="tree")
+    parser.add_argument("--optimize", action="store_true")
+    args = parser.parse_args(argv)
+
+    options = {"backend": args.backend, "optimize": args.optimize}
+    if args.socket:
+        asyncio.run(serve_unix(args.socket, **options))
+    else:
+        serve(sys.stdin, sys.stdout, **options)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,134 @@
+import re
+from array import array
+from bisect import bisect_right
+
+from .lexer import line_starts, BYTES_NEWLINE
+
+# Tokens and nodes record where they start as a single integer offset into
+# the source text. Offsets are turned into line and column numbers only
+# when an error is reported, so the hot path never counts lines.
+
+_LINE_ENDINGS = "\r\n\v\f\x1c\x1d\x1e\x85\u2028\u2029"
+
+_BYTES_NEWLINE_PATTERN = re.compile(BYTES_NEWLINE)
+
+
+class SourceMap:
+    __slots__ = ("line_starts", "code")
+
+    def __init__(self, line_starts=None, code=None):
+        if line_starts is None:
+            line_starts = array("q", [0])
+        self.line_starts = line_starts
+        self.code = code
+
+    @classmethod
+    def from_code(cls, code):
+        return cls(line_starts(code), code)
+
+    def add_line(self, start, text):
+        if start:
+            self.line_starts.append(start)
+
+    def location(self, pos):
+        line = bisect_right(self.line_starts, pos)
+        return line, pos - self.line_starts[line - 1] + 1
+
+    def line_text(self, line):
+        if self.code is None:
+            return None
+        start = self.line_starts[line - 1]
+        if line < len(self.line_starts):
+            end = self.line_starts[line]
+        else:
+            end = len(self.code)
+        return self.code[start:end].rstrip(_LINE_ENDINGS)
+
+
+class LineSourceMap:
+    # Maps offsets in input read a line at a time, such as a stream. Only
+    # the line being read is remembered, so memory stays the same however
+    # long the input; an error is located only if it is raised while its
+    # line is still the current one, as it is when each statement runs as
+    # soon as it has been parsed.
+    __slots__ = ("line", "start", "text")
+
+    def __init__(self):
+        self.line = 0
+        self.start = 0
+        self.text = None
+
+    def add_line(self, start, text):
+        self.line += 1
+        self.start = start
+        self.text = text
+
+    def location(self, pos):
+        if pos < self.start:
+            return None
+        return self.line, pos - self.start + 1
+
+    def line_text(self, line):
+        if line != self.line:
+            return None
+        return self.text.rstrip(_LINE_ENDINGS)
+
+
+class BufferSourceMap:
+    # Maps byte offsets in UTF-8 encoded source, such as a memory-mapped
+    # file. Line starts are not kept, since that would take memory
+    # proportional to the file; they are found by scanning when an error
+    # is reported.
+    __slots__ = ("buffer",)
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def location(self, pos):
+        line, start = self._line_start(pos)
+        column = bytes(self.buffer[start:pos]).decode(errors="replace")
+        return line, len(column) + 1
+
+    def line_text(self, line):
+        start = 0
+        matches = _BYTES_NEWLINE_PATTERN.finditer(self.buffer)
+        for _, match in zip(range(line - 1), matches):
+            start = match.end()
+        match = _BYTES_NEWLINE_PATTERN.search(self.buffer, start)
+        end = len(self.buffer) if match is None else match.start()
+        return bytes(self.buffer[start:end]).decode(errors="replace")
+
+    def _line_start(self, pos):
+        line = 1
+        start = 0
+        for match in _BYTES_NEWLINE_PATTERN.finditer(self.buffer, 0, pos):
+            line += 1
+            start = match.end()
+        return line, start
+
+
+def locate(error, source_map):
+    pos = getattr(error, "pos", None)
+    if pos is None or pos < 0 or source_map is None:
+        return error
+
+    location = source_map.location(pos)
+    if location is None:
+        return error
+
+    line, column = location
+    error.lineno = line
+    error.offset = column
+    if isinstance(error, SyntaxError):
+        error.text = source_map.line_text(line)
+    else:
+        error.add_note(f"at line {line}, column {column}")
+    return error
+
+
+def set_position(error, pos):
+    # The innermost position wins: a statement-level position never
+    # overwrites one recorded closer to the failing expression.
+    if getattr(error, "pos", None) is None:
+        error.pos = pos
+    return error
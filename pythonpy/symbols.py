@@ -0,0 +1,99 @@
+from .nodes import PrintNode, BinOpNode, AssignNode, NameNode
+
+UNDEFINED = object()
+
+
+class SymbolTable:
+    __slots__ = ("names", "_slots")
+
+    def __init__(self, names=()):
+        self.names = []
+        self._slots = {}
+        for name in names:
+            self.resolve(name)
+
+    def resolve(self, name):
+        slot = self._slots.get(name)
+        if slot is None:
+            slot = self._slots[name] = len(self.names)
+            self.names.append(name)
+        return slot
+
+    def slot(self, name):
+        return self._slots[name]
+
+    def __contains__(self, name):
+        return name in self._slots
+
+    def __len__(self):
+        return len(self.names)
+
+    def __repr__(self):
+        return f"SymbolTable({self.names})"
+
+
+def resolve_symbols(node, symbols=None):
+    if symbols is None:
+        symbols = SymbolTable()
+
+    for statement in node.statements:
+        if isinstance(statement, PrintNode):
+            stack = [statement.value]
+        elif isinstance(statement, AssignNode):
+            symbols.resolve(statement.var_name)
+            stack = [statement.expr]
+        else:
+            continue
+
+        while stack:
+            expr = stack.pop()
+            if isinstance(expr, BinOpNode):
+                stack.append(expr.right)
+                stack.append(expr.left)
+            elif isinstance(expr, NameNode):
+                symbols.resolve(expr.var_name)
+
+    return symbols
+
+
+class SlotEnvironment:
+    __slots__ = ("symbols", "values")
+
+    def __init__(self, symbols, env=None):
+        self.symbols = symbols
+        self.values = [UNDEFINED] * len(symbols)
+        if env:
+            for slot, name in enumerate(symbols.names):
+                self.values[slot] = env.get(name, UNDEFINED)
+
+    def load(self, slot):
+        value = self.values[slot]
+        if value is UNDEFINED:
+            raise NameError(f"Undefined variable: {self.symbols.names[slot]}")
+        return value
+
+    def store(self, slot, value):
+        self.values[slot] = value
+
+    def to_dict(self):
+        return {
+            name: value
+            for name, value in zip(self.symbols.names, self.values)
+            if value is not UNDEFINED
+        }
+
+    def __repr__(self):
+        return f"SlotEnvironment({self.to_dict()})"
+
+
+def names_read(expr):
+    names = set()
+    stack = [expr]
+    while stack:
+        expr = stack.pop()
+        if isinstance(expr, BinOpNode):
+            stack.append(expr.right)
+            stack.append(expr.left)
+        elif isinstance(expr, NameNode):
+            names.add(expr.var_name)
+    return frozenset(names)
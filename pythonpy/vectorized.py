@@ -0,0 +1,118 @@
+import io
+import operator
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .batch import BatchResult
+from .evaluator import evaluate_expr
+from .lexer import tokenize_stream
+from .nodes import PrintNode, AssignNode
+from .parser import parse_program
+
+# Evaluates one program for many rows at once: every variable holds a
+# NumPy array with one element per row, so each BinOpNode is a single
+# array operation. Rows fail independently, as if each had been run on
+# its own; a failed row stops producing output. Arithmetic follows the
+# arrays' dtype, so int64 inputs wrap on overflow where Python ints
+# would not (use dtype=object for exact results).
+
+
+class VectorizedRun:
+    def __init__(self, rows):
+        if np is None:
+            raise ImportError("Vectorized evaluation requires NumPy")
+
+        self.rows = rows
+        self.alive = np.ones(rows, dtype=bool)
+        self.errors = [None] * rows
+        self.operators = {
+            "+": operator.add,
+            "-": operator.sub,
+            "*": operator.mul,
+            "/": self.divide,
+        }
+
+    def divide(self, left, right):
+        if not isinstance(left, np.ndarray) and (
+            not isinstance(right, np.ndarray)
+        ):
+            if right == 0:
+                self.fail(self.alive, ValueError("Division by zero"))
+                return 0
+            return left // right
+
+        zero = np.equal(right, 0)
+        if zero.any():
+            self.fail(zero, ValueError("Division by zero"))
+            right = np.where(zero, 1, right)
+        return np.floor_divide(left, right)
+
+    def fail(self, mask, error):
+        rows = np.flatnonzero(np.broadcast_to(mask, self.alive.shape)
+                              & self.alive)
+        for row in rows:
+            self.errors[row] = error
+        self.alive[rows] = False
+
+
+def stack_envs(envs, dtype=object):
+    if np is None:
+        raise ImportError("Vectorized evaluation requires NumPy")
+
+    names = set(envs[0]) if envs else set()
+    for env in envs:
+        if set(env) != names:
+            raise ValueError("All environments must bind the same names")
+    return {
+        name: np.array([env[name] for env in envs], dtype=dtype)
+        for name in names
+    }
+
+
+def evaluate_vectorized(node, env, fouts):
+    run = VectorizedRun(len(fouts))
+
+    for statement in node.statements:
+        if not run.alive.any():
+            break
+
+        try:
+            if isinstance(statement, PrintNode):
+                if statement.value is None:
+                    value = ""
+                else:
+                    value = evaluate_expr(statement.value, env,
+                                          run.operators)
+                if isinstance(value, np.ndarray):
+                    for row in np.flatnonzero(run.alive):
+                        fouts[row].write(f"{value[row]}\n")
+                else:
+                    line = f"{value}\n"
+                    for row in np.flatnonzero(run.alive):
+                        fouts[row].write(line)
+
+            elif isinstance(statement, AssignNode):
+                env[statement.var_name] = evaluate_expr(
+                    statement.expr, env, run.operators
+                )
+
+            else:
+                raise TypeError("Unknown node type")
+
+        except NameError as error:
+            run.fail(run.alive.copy(), error)
+
+    return run.errors
+
+
+def run_vectorized(code, envs):
+    program = parse_program(tokenize_stream(code))
+    fouts = [io.StringIO() for _ in envs]
+    errors = evaluate_vectorized(program, stack_envs(envs), fouts)
+    return [
+        BatchResult(fout.getvalue(), error)
+        for fout, error in zip(fouts, errors)
+    ]
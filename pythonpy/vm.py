@@ -0,0 +1,205 @@
+from array import array
+from bisect import bisect_right
+from operator import length_hint
+
+from .cache import CompiledCache
+from .flat import NO_POSITION
+from .nodes import ProgramNode, PrintNode, BinOpNode, AssignNode, NameNode
+from .source import set_position
+from .symbols import SymbolTable, SlotEnvironment, UNDEFINED
+
+# Instructions are (opcode, argument) pairs stored back to back in one
+# array. LOAD_CONST indexes the constant table; LOAD_NAME and STORE_NAME
+# index the variable slots, which are resolved from names at compile time.
+# The pc of each statement's first instruction is recorded along with the
+# statement's position, so an error can be traced back to its statement
+# without the loop doing any bookkeeping.
+(
+    LOAD_CONST, LOAD_NAME, STORE_NAME, BINARY_ADD, BINARY_SUBTRACT,
+    BINARY_MULTIPLY, BINARY_DIVIDE, PRINT_VALUE, PRINT_NEWLINE,
+) = range(9)
+
+OPNAMES = [
+    "LOAD_CONST", "LOAD_NAME", "STORE_NAME", "BINARY_ADD", "BINARY_SUBTRACT",
+    "BINARY_MULTIPLY", "BINARY_DIVIDE", "PRINT_VALUE", "PRINT_NEWLINE",
+]
+
+_BINARY_INSTRUCTIONS = {
+    "+": (BINARY_ADD, 0),
+    "-": (BINARY_SUBTRACT, 0),
+    "*": (BINARY_MULTIPLY, 0),
+    "/": (BINARY_DIVIDE, 0),
+}
+_PRINT_VALUE = (PRINT_VALUE, 0)
+_PRINT_NEWLINE = (PRINT_NEWLINE, 0)
+
+
+class Bytecode:
+    __slots__ = ("code", "constants", "symbols", "starts", "positions")
+
+    def __init__(self, code, constants, symbols, starts=None,
+                 positions=None):
+        self.code = code
+        self.constants = constants
+        self.symbols = symbols
+        self.starts = array("q") if starts is None else starts
+        self.positions = array("q") if positions is None else positions
+
+    @property
+    def names(self):
+        return self.symbols.names
+
+    def position(self, pc):
+        statement = bisect_right(self.starts, pc) - 1
+        if statement < 0 or statement >= len(self.positions):
+            return None
+        pos = self.positions[statement]
+        return None if pos == NO_POSITION else pos
+
+    def __len__(self):
+        return len(self.code) // 2
+
+    def __repr__(self):
+        return f"Bytecode({len(self)} instructions, {len(self.names)} slots)"
+
+    def disassemble(self):
+        lines = []
+        it = iter(self.code)
+        for pc, (opcode, arg) in enumerate(zip(it, it)):
+            if opcode == LOAD_CONST:
+                detail = f" {arg} ({self.constants[arg]!r})"
+            elif opcode in (LOAD_NAME, STORE_NAME):
+                detail = f" {arg} ({self.names[arg]})"
+            else:
+                detail = ""
+            lines.append(f"{pc:>6} {OPNAMES[opcode]}{detail}")
+        return "\n".join(lines)
+
+
+def compile_bytecode(node, symbols=None):
+    # Expressions are emitted in postorder, which is stack-machine order,
+    # straight from the tree: going through the flat encoding first cost
+    # more than the tree-walker takes to run the whole program.
+    if not isinstance(node, ProgramNode):
+        raise TypeError("Unknown node type")
+
+    if symbols is None:
+        symbols = SymbolTable()
+    resolve = symbols.resolve
+    constants = []
+    constant_index = {}
+    code = []
+    emit = code.extend
+    starts = array("q")
+    positions = array("q")
+    # Operators' instructions are pushed beneath their operands and emitted
+    # once both have been.
+    stack = []
+    push = stack.append
+    pop = stack.pop
+
+    for statement in node.statements:
+        starts.append(len(code) // 2)
+        positions.append(
+            NO_POSITION if statement.pos is None else statement.pos
+        )
+
+        if isinstance(statement, PrintNode):
+            if statement.value is None:
+                emit(_PRINT_NEWLINE)
+                continue
+            push(statement.value)
+            last = _PRINT_VALUE
+        elif isinstance(statement, AssignNode):
+            push(statement.expr)
+            last = (STORE_NAME, resolve(statement.var_name))
+        else:
+            raise TypeError("Unknown node type")
+
+        while stack:
+            item = pop()
+            kind = type(item)
+            if kind is BinOpNode:
+                instruction = _BINARY_INSTRUCTIONS.get(item.op)
+                if instruction is None:
+                    raise ValueError(f"Unknown operator: {item.op}")
+                push(instruction)
+                push(item.right)
+                push(item.left)
+            elif kind is tuple:
+                emit(item)
+            elif kind is NameNode:
+                emit((LOAD_NAME, resolve(item.var_name)))
+            elif isinstance(item, int):
+                key = item if kind is int else (kind, item)
+                index = constant_index.get(key)
+                if index is None:
+                    index = constant_index[key] = len(constants)
+                    constants.append(item)
+                emit((LOAD_CONST, index))
+            else:
+                raise TypeError("Unsupported expression node")
+        emit(last)
+
+    return Bytecode(array("q", code), constants, symbols, starts, positions)
+
+
+def run(bytecode, env, fout):
+    environment = SlotEnvironment(bytecode.symbols, env)
+    try:
+        run_slots(bytecode, environment, fout)
+    finally:
+        env.update(environment.to_dict())
+
+
+def run_slots(bytecode, environment, fout):
+    constants = bytecode.constants
+    names = bytecode.names
+    slots = environment.values
+    stack = []
+    push = stack.append
+    pop = stack.pop
+    it = iter(bytecode.code)
+
+    try:
+        for opcode, arg in zip(it, it):
+            if opcode == LOAD_NAME:
+                value = slots[arg]
+                if value is UNDEFINED:
+                    raise NameError(f"Undefined variable: {names[arg]}")
+                push(value)
+            elif opcode == LOAD_CONST:
+                push(constants[arg])
+            elif opcode == BINARY_ADD:
+                right = pop()
+                stack[-1] = stack[-1] + right
+            elif opcode == BINARY_SUBTRACT:
+                right = pop()
+                stack[-1] = stack[-1] - right
+            elif opcode == BINARY_MULTIPLY:
+                right = pop()
+                stack[-1] = stack[-1] * right
+            elif opcode == BINARY_DIVIDE:
+                right = pop()
+                if right == 0:
+                    raise ValueError("Division by zero")
+                stack[-1] = stack[-1] // right
+            elif opcode == STORE_NAME:
+                slots[arg] = pop()
+            elif opcode == PRINT_VALUE:
+                fout.write(f"{pop()}\n")
+            else:
+                fout.write("\n")
+    except (NameError, ValueError) as error:
+        # The failing instruction is the last pair taken from the code.
+        pc = (len(bytecode.code) - length_hint(it)) // 2 - 1
+        raise set_position(error, bytecode.position(pc))
+
+
+# Compiling to bytecode costs more than walking the tree once, so programs
+# that main() read whole keep their bytecode for later runs.
+_programs = CompiledCache(compile_bytecode)
+
+
+def execute(node, env, fout):
+    run(_programs.get(node), env, fout)
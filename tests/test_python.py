@@ -1,13 +1,43 @@
+import asyncio
 import unittest
 import io
+import json
+import os
+import socket
+import tempfile
+import threading
+from unittest import mock
+from concurrent.futures import ProcessPoolExecutor
 from pythonpy.lexer import Token, tokenize_program, tokenize_line
-from pythonpy.parser import parse_statement, parse_program
+from pythonpy.lexer import tokenize_lines, tokenize_buffer, tokenize_stream
+from pythonpy import lexer
+from pythonpy.parser import parse_statement, parse_program, parse_statements
 from pythonpy.parser import parse_atom, parse_expr, parse_factor, parse_term
 from pythonpy.evaluator import evaluate, evaluate_expr
 from pythonpy.nodes import (
     ProgramNode, PrintNode, BinOpNode, AssignNode, NameNode
 )
-from pythonpy.main import main
+from pythonpy.compiler import compile_program, compile_expr
+from pythonpy.optimizer import fold_constants, fold_expr
+from pythonpy.optimizer import eliminate_dead_stores
+from pythonpy.flat import flatten, unflatten, evaluate_flat
+from pythonpy import compiler, vm
+from pythonpy.aio import main_async, evaluate_async
+from pythonpy.batch import BatchResult, run_batch, run_program
+from pythonpy import vectorized
+from pythonpy.profiler import Profiler
+from benchmarks.suite import compare as compare_benchmarks
+from pythonpy.output import OutputBuffer
+from pythonpy import cache as program_cache
+from pythonpy.symbols import SymbolTable, SlotEnvironment, resolve_symbols
+from pythonpy.main import main, BACKENDS
+from pythonpy.source import SourceMap, LineSourceMap
+from pythonpy.incremental import IncrementalSession
+from pythonpy import session as server
+from pythonpy.cse import NodeInterner, SharedEvaluator
+from pythonpy.budget import Budget, BudgetExceeded
+from pythonpy import parallel
+from pythonpy import scheduler
 
 
 class TestTokenizeProgram(unittest.TestCase):
@@ -34,6 +64,30 @@ class TestTokenizeProgram(unittest.TestCase):
         )
 
 
+class TestTokenizeLines(unittest.TestCase):
+    def test(self):
+        lines = io.StringIO("print()\n\r\nx = 1\r\n")
+        token_lines = tokenize_lines(lines)
+        self.assertEqual(
+            next(token_lines),
+            [
+                Token("PRINT", "print"),
+                Token("LPAREN", "("),
+                Token("RPAREN", ")")
+            ],
+        )
+        self.assertEqual(
+            next(token_lines),
+            [
+                Token("IDENTIFIER", "x"),
+                Token("EQUALS", "="),
+                Token("NUMBER", "1")
+            ],
+        )
+        with self.assertRaises(StopIteration):
+            next(token_lines)
+
+
 class TestTokenizeLine(unittest.TestCase):
     def test(self):
         specs = [
@@ -86,7 +140,15 @@ class TestTokenizeLine(unittest.TestCase):
                     Token("EQUALS", "="),
                     Token("NUMBER", "1")
                 ]
-            }
+            },
+            {
+                "line": "printer = 1",
+                "expected": [
+                    Token("IDENTIFIER", "printer"),
+                    Token("EQUALS", "="),
+                    Token("NUMBER", "1")
+                ]
+            },
         ]
 
         for spec in specs:
@@ -94,6 +156,123 @@ class TestTokenizeLine(unittest.TestCase):
                 tokens = tokenize_line(spec["line"])
                 self.assertEqual(tokens, spec["expected"])
 
+    def test_error(self):
+        with self.assertRaisesRegex(SyntaxError, "'\\$' at position 4"):
+            tokenize_line("x = $")
+
+    def test_line_break(self):
+        self.assertEqual(tokenize_line("x\x0c\n"), [Token("IDENTIFIER", "x")])
+        with self.assertRaisesRegex(SyntaxError, "line break at position 5"):
+            tokenize_line("x = 1\x0cprint(x)")
+
+    def test_positions(self):
+        tokens = tokenize_line("x = 1+ y", offset=10)
+        self.assertEqual([t.pos for t in tokens], [10, 12, 14, 15, 17])
+
+
+class TestTokenizeBuffer(unittest.TestCase):
+    def test(self):
+        codes = [
+            "print()\nprint(1+2)",
+            "x = 1\r\n\n  y=(x*3)/2\n",
+            "\u00e91 = 5\x85print(\u00e91 + ab1\u00e9)",
+            "x = \u0663 + 1\u0663\u2028y = x",
+            "a = \u00b2\f\u00b21 = a",
+        ]
+        for code in codes:
+            with self.subTest(code=code):
+                buffer = code.encode()
+                token_lines = list(tokenize_buffer(buffer))
+                self.assertEqual(token_lines, tokenize_program(code))
+                self.assertEqual(
+                    [len(buffer[:t.pos].decode())
+                     for tokens in token_lines for t in tokens],
+                    [t.pos for tokens in tokenize_program(code)
+                     for t in tokens],
+                )
+
+    def test_errors(self):
+        specs = [
+            {"code": "x = 1 $", "message": "'\\$' at position 6"},
+            {"code": "\u00e9 = 1 \u00e9$", "message": "'\\$' at position 7"},
+            {"code": "a_\u00e9 = 1", "message": "'_' at position 1"},
+            {"code": "a = \u00a0", "message": "'\u00a0' at position 4"},
+            {"code": "x = 1\n  y = 2a$", "message": "'\\$' at position 8"},
+        ]
+        for spec in specs:
+            with self.subTest(spec=spec):
+                with self.assertRaisesRegex(SyntaxError, spec["message"]):
+                    list(tokenize_buffer(spec["code"].encode()))
+                with self.assertRaisesRegex(SyntaxError, spec["message"]):
+                    tokenize_program(spec["code"])
+
+    def test_invalid_utf8(self):
+        with self.assertRaisesRegex(SyntaxError, "Invalid UTF-8"):
+            list(tokenize_buffer(b"x = 1\ny = \xff"))
+
+
+class TestTokenizeStream(unittest.TestCase):
+    def test(self):
+        stream = tokenize_stream("ab = 12\n\n  print(ab * 3)\r\n")
+        self.assertEqual(list(stream.kinds), [
+            lexer.IDENTIFIER, lexer.EQUALS, lexer.NUMBER, lexer.PRINT,
+            lexer.LPAREN, lexer.IDENTIFIER, lexer.MULTIPLY, lexer.NUMBER,
+            lexer.RPAREN,
+        ])
+        self.assertEqual(stream.values,
+                         ["ab", "=", 12, "print", "(", "ab", "*", 3, ")"])
+        self.assertEqual(list(stream.positions),
+                         [0, 3, 5, 11, 16, 17, 20, 22, 23])
+        self.assertEqual(list(stream.lines), [0, 3])
+        self.assertEqual(stream.line(1), (3, 9))
+        self.assertIs(stream.values[0], stream.values[5])
+
+    def test_token_lines(self):
+        codes = [
+            "",
+            "print()\nprint(1+2)",
+            "x = 007\r\n\n  y=(x*3)/2\n",
+            "\u00e91 = 5\x85print(\u00e91 + ab1\u00e9)",
+            "x = \u0663 + 1\u0663\u2028y = x",
+            "12ab = x\u00b2\t+ 1\x0c z\r\r\nprint( 3y )",
+        ]
+        for code in codes:
+            with self.subTest(code=code):
+                token_lines = [
+                    tokenize_line(line, start)
+                    for line, start in zip(code.splitlines(),
+                                           lexer.line_starts(code))
+                ]
+                token_lines = [tokens for tokens in token_lines if tokens]
+                self.assertEqual(list(tokenize_stream(code)), token_lines)
+                self.assertEqual(
+                    [t.pos for tokens in tokenize_program(code)
+                     for t in tokens],
+                    [t.pos for tokens in token_lines for t in tokens],
+                )
+
+    def test_parse(self):
+        code = "a = 1 + 2 * 3\nprint(a / (a - 4))\nprint()"
+        program = parse_program(tokenize_stream(code))
+        expected = parse_program(
+            [tokenize_line(line) for line in code.splitlines()]
+        )
+        self.assertEqual(program.statements, expected.statements)
+        self.assertEqual([s.pos for s in program.statements], [0, 14, 33])
+
+    def test_parse_errors(self):
+        specs = [
+            {"code": "x = 1\nprint(1 +)", "pos": 15},
+            {"code": "x = (1 + 2", "pos": 10},
+            {"code": "x = 1\ny = = 2", "pos": 10},
+            {"code": "1 = x", "pos": 0},
+        ]
+        for spec in specs:
+            with self.subTest(spec=spec):
+                with self.assertRaises(SyntaxError) as cm:
+                    parse_program(tokenize_stream(spec["code"]))
+                self.assertEqual(cm.exception.pos, spec["pos"])
+
 
 class TestParseProgram(unittest.TestCase):
     def test(self):
@@ -122,6 +301,22 @@ class TestParseProgram(unittest.TestCase):
         )
 
 
+class TestParseStatements(unittest.TestCase):
+    def test(self):
+        token_lines = iter([
+            [
+                Token("PRINT", "print"),
+                Token("LPAREN", "("),
+                Token("RPAREN", ")")
+            ],
+            [Token("PRINT", "print"), Token("LPAREN", "(")],
+        ])
+        statements = parse_statements(token_lines)
+        self.assertEqual(next(statements), PrintNode())
+        with self.assertRaises(SyntaxError):
+            next(statements)
+
+
 class TestParseAtom(unittest.TestCase):
     def test(self):
         for val in [42, 3]:
@@ -373,6 +568,18 @@ class TestParseFactor(unittest.TestCase):
         self.assertEqual(value, BinOpNode(1, "+", 2))
         self.assertEqual(i, 5)
 
+    def test_deeply_nested(self):
+        depth = 100000
+        tokens = [
+            *[Token("LPAREN", "(")] * depth,
+            Token("IDENTIFIER", "x"),
+            *[Token("RPAREN", ")")] * depth,
+            Token("MULTIPLY", "*"),
+        ]
+        node, i = parse_factor(tokens, 0)
+        self.assertEqual(node, NameNode("x"))
+        self.assertEqual(i, 2 * depth + 1)
+
     def test_syntax_error(self):
         tokens = [Token("NUMBER", 1), Token("PLUS", "+")]
         specs = [{"index": 1}, {"index": 2}]
@@ -451,6 +658,15 @@ class TestEvaluatExpr(unittest.TestCase):
                 result = evaluate_expr(spec['expr'], spec['env'])
                 self.assertEqual(result, spec['expected'])
 
+    def test_deeply_nested(self):
+        expr = NameNode("x")
+        for i in range(100000):
+            if i % 2:
+                expr = BinOpNode(1, "+", expr)
+            else:
+                expr = BinOpNode(expr, "-", 1)
+        self.assertEqual(evaluate_expr(expr, {"x": 5}), 5)
+
     def test_exceptions(self):
         specs = [
             {"expr": BinOpNode(2, "~", 3), "env": {}, "exception": ValueError},
@@ -519,6 +735,815 @@ class TestEvaluate(unittest.TestCase):
                 self.assertEqual(env[spec['var_name']], spec['expected'])
 
 
+class TestCompileExpr(unittest.TestCase):
+    def test(self):
+        specs = [
+            {"expr": 2, "env": {}, "expected": 2},
+            {"expr": BinOpNode(2, "+", 3), "env": {}, "expected": 5},
+            {"expr": BinOpNode(2, "-", 3), "env": {}, "expected": -1},
+            {"expr": BinOpNode(2, "*", 3), "env": {}, "expected": 6},
+            {"expr": BinOpNode(7, "/", 2), "env": {}, "expected": 3},
+            {"expr": NameNode("x"), "env": {"x": 1}, "expected": 1},
+        ]
+
+        for spec in specs:
+            with self.subTest(spec=spec):
+                result = compile_expr(spec['expr'])(spec['env'])
+                self.assertEqual(result, spec['expected'])
+
+    def test_exceptions(self):
+        specs = [
+            {"expr": BinOpNode(2, "~", 3), "exception": ValueError},
+            {"expr": None, "exception": TypeError},
+            {"expr": BinOpNode(2, "/", 0), "exception": ValueError},
+            {"expr": NameNode("x"), "exception": NameError},
+        ]
+        for spec in specs:
+            with self.subTest(spec=spec):
+                run = compile_expr(spec["expr"])
+                with self.assertRaises(spec["exception"]):
+                    run({})
+
+
+class TestCompileProgram(unittest.TestCase):
+    def test(self):
+        node = ProgramNode([
+            AssignNode("x", BinOpNode(1, "+", 2)),
+            PrintNode(),
+            PrintNode(BinOpNode(NameNode("x"), "*", 2)),
+        ])
+        run = compile_program(node)
+        for _ in range(2):
+            env = {}
+            fout = io.StringIO()
+            run(env, fout)
+            self.assertEqual(fout.getvalue(), "\n6\n")
+            self.assertEqual(env, {"x": 3})
+
+    def test_deeply_nested(self):
+        expr = 1
+        for _ in range(300):
+            expr = BinOpNode(expr, "*", NameNode("x"))
+        run = compile_program(ProgramNode([PrintNode(expr)]))
+        fout = io.StringIO()
+        run({"x": 1}, fout)
+        self.assertEqual(fout.getvalue(), "1\n")
+        with self.assertRaises(NameError):
+            run({}, fout)
+
+    def test_batches(self):
+        # Statements are compiled in batches; errors still name their line,
+        # and identical batches share compiled code.
+        code = "x = 1\nprint(x)\n" * 300 + "print(y)\n"
+        fout = io.StringIO()
+        with self.assertRaises(NameError) as cm:
+            main(io.StringIO(code), fout, backend="compiled")
+        self.assertEqual(cm.exception.lineno, 601)
+        self.assertEqual(fout.getvalue(), "1\n" * 300)
+
+        # Too deeply nested for the Python compiler, so the batch falls
+        # back to compiling statement by statement.
+        deep = "x = 1\nprint(" + "x*(" * 1000 + "x" + ")" * 1000 + ")\n"
+        fout = io.StringIO()
+        with self.assertRaises(ValueError) as cm:
+            main(io.StringIO(deep + "print(1/0)"), fout, backend="compiled")
+        self.assertEqual(cm.exception.lineno, 3)
+        self.assertEqual(fout.getvalue(), "1\n")
+
+
+class TestFoldExpr(unittest.TestCase):
+    def test(self):
+        x = NameNode("x")
+        specs = [
+            {"expr": 2, "expected": 2},
+            {"expr": x, "expected": x},
+            {"expr": BinOpNode(1, "+", 2), "expected": 3},
+            {"expr": BinOpNode(1, "-", 2), "expected": -1},
+            {"expr": BinOpNode(3, "*", 4), "expected": 12},
+            {"expr": BinOpNode(7, "/", 2), "expected": 3},
+            {
+                "expr": BinOpNode(BinOpNode(1, "+", 2), "*",
+                                  BinOpNode(3, "+", 4)),
+                "expected": 21,
+            },
+            {"expr": BinOpNode(x, "*", 1), "expected": x},
+            {"expr": BinOpNode(1, "*", x), "expected": x},
+            {"expr": BinOpNode(x, "+", 0), "expected": x},
+            {"expr": BinOpNode(0, "+", x), "expected": x},
+            {"expr": BinOpNode(x, "-", 0), "expected": x},
+            {"expr": BinOpNode(x, "/", 1), "expected": x},
+            {
+                "expr": BinOpNode(x, "+", BinOpNode(2, "-", 2)),
+                "expected": x,
+            },
+            {
+                "expr": BinOpNode(x, "+", BinOpNode(2, "*", 3)),
+                "expected": BinOpNode(x, "+", 6),
+            },
+            {"expr": BinOpNode(x, "*", 0), "expected": BinOpNode(x, "*", 0)},
+            {"expr": BinOpNode(1, "/", 0), "expected": BinOpNode(1, "/", 0)},
+            {
+                "expr": BinOpNode(BinOpNode(1, "/", 0), "*", 0),
+                "expected": BinOpNode(BinOpNode(1, "/", 0), "*", 0),
+            },
+            {"expr": BinOpNode(2, "~", 3), "expected": BinOpNode(2, "~", 3)},
+        ]
+        for spec in specs:
+            with self.subTest(spec=spec):
+                self.assertEqual(fold_expr(spec["expr"]), spec["expected"])
+
+
+class TestFoldConstants(unittest.TestCase):
+    def test(self):
+        x = NameNode("x")
+        node = ProgramNode([
+            PrintNode(),
+            AssignNode("x", BinOpNode(BinOpNode(1, "+", 2), "*", 3)),
+            PrintNode(BinOpNode(x, "*", 1)),
+            PrintNode(x),
+        ])
+        folded, eliminated = fold_constants(node)
+        self.assertEqual(
+            folded.statements,
+            [PrintNode(), AssignNode("x", 9), PrintNode(x), PrintNode(x)]
+        )
+        self.assertEqual(eliminated, 6)
+
+    def test_main(self):
+        for spec in PROGRAM_SPECS:
+            with self.subTest(spec=spec):
+                fin = io.StringIO(spec["code"])
+                fout = io.StringIO()
+                main(fin, fout, optimize=True)
+
+                self.assertEqual(fout.getvalue(), spec["expected"])
+
+    def test_main_errors(self):
+        for spec in ERROR_SPECS:
+            with self.subTest(spec=spec):
+                fin = io.StringIO(spec["code"])
+                fout = io.StringIO()
+                with self.assertRaises(spec["exception"]):
+                    main(fin, fout, optimize=True)
+
+                self.assertEqual(fout.getvalue(), spec["expected"])
+
+
+class TestEliminateDeadStores(unittest.TestCase):
+    def parse(self, code):
+        return parse_program(tokenize_program(code)).statements
+
+    def test(self):
+        specs = [
+            {"code": "x = 1\nx = 2\nprint(x)",
+             "expected": "x = 2\nprint(x)"},
+            {"code": "a = 1\nb = a * 2\nb = 3\nprint(b)",
+             "expected": "b = 3\nprint(b)"},
+            {"code": "a = 1\nb = a * 2\nprint(b)\nc = b",
+             "expected": "a = 1\nb = a * 2\nprint(b)"},
+            # Assignments that may raise are kept.
+            {"code": "x = y\nx = 1 / 0\nx = 4 / 2\nprint(x)",
+             "expected": "x = y\nx = 1 / 0\nx = 4 / 2\nprint(x)"},
+            {"code": "a = 0\nb = 1 / a\nprint(a)",
+             "expected": "a = 0\nb = 1 / a\nprint(a)"},
+        ]
+        for spec in specs:
+            with self.subTest(spec=spec):
+                statements = self.parse(spec["code"])
+                node, removed = eliminate_dead_stores(ProgramNode(statements))
+                expected = self.parse(spec["expected"])
+                self.assertEqual(node.statements, expected)
+                self.assertEqual(removed, len(statements) - len(expected))
+
+    def test_defined_and_keep_final(self):
+        statements = self.parse("x = y + 1\nx = 2\nz = x")
+        node, removed = eliminate_dead_stores(ProgramNode(statements))
+        self.assertEqual(node.statements, statements[:1])
+        node, removed = eliminate_dead_stores(
+            ProgramNode(statements), defined={"y"}
+        )
+        self.assertEqual(node.statements, [])
+        node, removed = eliminate_dead_stores(
+            ProgramNode(statements), defined={"y"}, keep_final=True
+        )
+        self.assertEqual(node.statements, statements[1:])
+        self.assertEqual(removed, 1)
+
+    def test_main(self):
+        fout = io.StringIO()
+        main(io.StringIO("x = 5\ny = x\ny = 2\nprint(y)"), fout,
+             optimize=True)
+        self.assertEqual(fout.getvalue(), "2\n")
+
+        env = {"x": 1}
+        main(io.StringIO("y = x\nz = y * 2"), io.StringIO(), optimize=True,
+             env=env)
+        self.assertEqual(env, {"x": 1, "y": 1, "z": 2})
+
+
+class TestNodeInterner(unittest.TestCase):
+    def test(self):
+        interner = NodeInterner()
+        code = "x = (a*b+c) * (a*b+c)\nprint(a*b + 1 - (a*b+c))"
+        program = parse_program(tokenize_program(code), interner)
+        self.assertEqual(program.statements,
+                         parse_program(tokenize_program(code)).statements)
+
+        assign, print_ = program.statements
+        self.assertIs(assign.expr.left, assign.expr.right)
+        self.assertIs(print_.value.right, assign.expr.left)
+        self.assertIs(print_.value.left.left, assign.expr.left.left)
+        # a, b, c, a*b, a*b+c, (a*b+c)*(a*b+c), a*b+1, a*b+1-(a*b+c)
+        self.assertEqual(len(interner), 8)
+        self.assertEqual(interner.requested, 21)
+
+    def test_constants(self):
+        interner = NodeInterner()
+        one = interner.binop(1, "+", 2)
+        self.assertIs(interner.binop(1, "+", 2), one)
+        self.assertIsNot(interner.binop(2, "+", 1), one)
+        self.assertIsNot(interner.binop(1, "-", 2), one)
+
+
+    def test_error_location(self):
+        # Shared nodes occur on several lines, so errors are reported at
+        # the failing statement.
+        code = "d = 2\nprint(10/d)\nd = 0\nprint(10/d)"
+        for backend in ("tree", "cse"):
+            with self.subTest(backend=backend):
+                fout = io.StringIO()
+                with self.assertRaises(ValueError) as cm:
+                    main(io.StringIO(code), fout, backend=backend,
+                         intern=True)
+                self.assertEqual(cm.exception.lineno, 4)
+                self.assertEqual(fout.getvalue(), "5\n")
+
+
+class TestSharedEvaluator(unittest.TestCase):
+    def run_shared(self, code):
+        program = parse_program(tokenize_program(code), NodeInterner())
+        evaluator = SharedEvaluator()
+        env = {}
+        fout = io.StringIO()
+        evaluator.evaluate(program, env, fout)
+
+        expected_env = {}
+        expected_out = io.StringIO()
+        evaluate(program, expected_env, expected_out)
+        self.assertEqual(fout.getvalue(), expected_out.getvalue())
+        self.assertEqual(env, expected_env)
+        return evaluator
+
+    def test(self):
+        evaluator = self.run_shared(
+            "a = 2\nb = 3\nc = 4\n"
+            "print((a*b+c) * (a*b+c) - (a*b+c))\n"
+            "print(a*b+c)\n"
+        )
+        self.assertEqual((evaluator.computed, evaluator.hits), (4, 3))
+
+    def test_invalidation(self):
+        evaluator = self.run_shared(
+            "a = 2\nb = 3\nc = 4\n"
+            "x = (a*b+c) * 2\n"
+            "c = c + 1\n"
+            "y = (a*b+c) * 2\n"
+            "a = a * b + 1\n"
+            "print((a*b+c) * 2 + x + y)\n"
+            "a = a\n"
+            "print((a*b+c) * 2)\n"
+        )
+        # a*b survives rebinding c and is reused twice; nothing survives
+        # rebinding a.
+        self.assertEqual(evaluator.hits, 2)
+
+    def test_main(self):
+        for backend in ("cse", "tree", "vm"):
+            for spec in PROGRAM_SPECS:
+                with self.subTest(backend=backend, spec=spec):
+                    fout = io.StringIO()
+                    main(io.StringIO(spec["code"]), fout, backend=backend,
+                         intern=True)
+                    self.assertEqual(fout.getvalue(), spec["expected"])
+
+    def test_errors(self):
+        with self.assertRaises(ValueError) as cm:
+            main(io.StringIO("a = 1\nb = a - 1\nprint(a / b)"),
+                 io.StringIO(), backend="cse", intern=True)
+        # Shared nodes have no position, so the statement's is reported.
+        self.assertEqual((cm.exception.lineno, cm.exception.offset), (3, 1))
+
+
+class TestFlatProgram(unittest.TestCase):
+    def test_roundtrip(self):
+        x = NameNode("x")
+        node = ProgramNode([
+            PrintNode(),
+            AssignNode("x", BinOpNode(BinOpNode(1, "+", 2), "*", 3)),
+            PrintNode(BinOpNode(x, "/", BinOpNode(x, "-", 1))),
+            PrintNode(x),
+        ])
+        program = flatten(node)
+        self.assertEqual(len(program), 4)
+        self.assertEqual(program.names, ["x"])
+        self.assertEqual(unflatten(program).statements, node.statements)
+
+    def test_evaluate(self):
+        x = NameNode("x")
+        node = ProgramNode([
+            AssignNode("x", BinOpNode(BinOpNode(1, "+", 2), "*", 3)),
+            PrintNode(),
+            PrintNode(BinOpNode(x, "/", BinOpNode(x, "-", 7))),
+        ])
+        env = {}
+        fout = io.StringIO()
+        evaluate_flat(flatten(node), env, fout)
+        self.assertEqual(fout.getvalue(), "\n4\n")
+        self.assertEqual(env, {"x": 9})
+
+    def test_deeply_nested(self):
+        expr = 1
+        for _ in range(10000):
+            expr = BinOpNode(expr, "+", 1)
+        fout = io.StringIO()
+        evaluate_flat(flatten(ProgramNode([PrintNode(expr)])), {}, fout)
+        self.assertEqual(fout.getvalue(), "10001\n")
+
+    def test_errors(self):
+        specs = [
+            {"expr": BinOpNode(2, "~", 3), "exception": ValueError},
+            {"expr": None, "exception": TypeError},
+        ]
+        for spec in specs:
+            with self.subTest(spec=spec):
+                statement = AssignNode("y", spec["expr"])
+                node = ProgramNode([PrintNode(1), statement])
+                with self.assertRaises(spec["exception"]):
+                    flatten(node)
+
+
+class TestSymbolTable(unittest.TestCase):
+    def test(self):
+        symbols = SymbolTable(["x"])
+        self.assertEqual(symbols.resolve("y"), 1)
+        self.assertEqual(symbols.resolve("x"), 0)
+        self.assertEqual(symbols.slot("y"), 1)
+        self.assertEqual(symbols.names, ["x", "y"])
+        self.assertIn("x", symbols)
+        self.assertNotIn("z", symbols)
+        self.assertEqual(len(symbols), 2)
+
+    def test_resolve_symbols(self):
+        node = ProgramNode([
+            PrintNode(),
+            AssignNode("b", BinOpNode(NameNode("a"), "+", 1)),
+            PrintNode(BinOpNode(NameNode("c"), "*", NameNode("a"))),
+        ])
+        self.assertEqual(resolve_symbols(node).names, ["b", "a", "c"])
+
+
+class TestSlotEnvironment(unittest.TestCase):
+    def test(self):
+        symbols = SymbolTable(["x", "y"])
+        environment = SlotEnvironment(symbols, {"x": 1, "z": 3})
+        self.assertEqual(environment.load(0), 1)
+        environment.store(1, 2)
+        self.assertEqual(environment.load(1), 2)
+        self.assertEqual(environment.to_dict(), {"x": 1, "y": 2})
+
+    def test_undefined(self):
+        environment = SlotEnvironment(SymbolTable(["x"]))
+        with self.assertRaisesRegex(NameError, "^Undefined variable: x$"):
+            environment.load(0)
+
+
+class TestBytecode(unittest.TestCase):
+    def test_compile(self):
+        x = NameNode("x")
+        node = ProgramNode([
+            AssignNode("x", BinOpNode(1, "+", 2)),
+            PrintNode(BinOpNode(x, "/", 2)),
+            PrintNode(),
+        ])
+        bytecode = vm.compile_bytecode(node)
+        self.assertEqual(bytecode.names, ["x"])
+        self.assertEqual(
+            list(bytecode.code),
+            [
+                vm.LOAD_CONST, 0, vm.LOAD_CONST, 1, vm.BINARY_ADD, 0,
+                vm.STORE_NAME, 0,
+                vm.LOAD_NAME, 0, vm.LOAD_CONST, 1, vm.BINARY_DIVIDE, 0,
+                vm.PRINT_VALUE, 0,
+                vm.PRINT_NEWLINE, 0,
+            ]
+        )
+        self.assertIn("STORE_NAME 0 (x)", bytecode.disassemble())
+        self.assertEqual(list(bytecode.starts), [0, 4, 8])
+
+    def test_compile_errors(self):
+        with self.assertRaises(ValueError):
+            vm.compile_bytecode(ProgramNode([PrintNode(BinOpNode(1, "%", 2))]))
+        with self.assertRaises(TypeError):
+            vm.compile_bytecode(ProgramNode([PrintNode(1.5)]))
+
+    def test_run(self):
+        x, y = NameNode("x"), NameNode("y")
+        node = ProgramNode([
+            AssignNode("x", BinOpNode(y, "*", 2)),
+            PrintNode(BinOpNode(x, "-", y)),
+            AssignNode("y", BinOpNode(x, "/", BinOpNode(y, "-", 3))),
+        ])
+        env = {"y": 3}
+        fout = io.StringIO()
+        with self.assertRaises(ValueError):
+            vm.run(vm.compile_bytecode(node), env, fout)
+        self.assertEqual(fout.getvalue(), "3\n")
+        self.assertEqual(env, {"x": 6, "y": 3})
+
+
+class TestProgramCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.directory = self.tmpdir.name
+
+    def entries(self):
+        return sorted(
+            name for name in os.listdir(self.directory)
+            if name.endswith(program_cache.SUFFIX)
+        )
+
+    def test_hit_and_miss(self):
+        cache = program_cache.ProgramCache(self.directory)
+        code = "a = 1\nprint(a + 2)"
+        first = cache.get_program(code)
+        second = cache.get_program(code)
+        self.assertEqual(second.statements, first.statements)
+        self.assertEqual((cache.stats.hits, cache.stats.misses), (1, 1))
+        self.assertEqual(len(self.entries()), 1)
+
+    def test_main(self):
+        cache = program_cache.ProgramCache(self.directory)
+        for _ in range(2):
+            for spec in PROGRAM_SPECS:
+                with self.subTest(spec=spec):
+                    fout = io.StringIO()
+                    main(io.StringIO(spec["code"]), fout, cache=cache)
+                    self.assertEqual(fout.getvalue(), spec["expected"])
+        self.assertEqual(cache.stats.hits, cache.stats.misses)
+
+    def test_stream_rejected(self):
+        cache = program_cache.ProgramCache(self.directory)
+        with self.assertRaises(ValueError):
+            main(io.StringIO("print()"), io.StringIO(), stream=True,
+                 cache=cache)
+
+    def test_intern_rejected(self):
+        cache = program_cache.ProgramCache(self.directory)
+        for options in ({"backend": "cse"}, {"intern": True}):
+            with self.subTest(options=options):
+                with self.assertRaises(ValueError):
+                    main(io.StringIO("print()"), io.StringIO(), cache=cache,
+                         **options)
+
+    def test_stale_entries_removed(self):
+        stale = os.path.join(
+            self.directory, "abc-0.0.0-0" + program_cache.SUFFIX
+        )
+        with open(stale, "wb") as f:
+            f.write(b"old")
+        program_cache.ProgramCache(self.directory)
+        self.assertEqual(self.entries(), [])
+
+    def test_corrupt_entry(self):
+        cache = program_cache.ProgramCache(self.directory)
+        cache.get_program("print(1)")
+        path = os.path.join(self.directory, self.entries()[0])
+        with open(path, "wb") as f:
+            f.write(b"garbage")
+        self.assertIsNone(cache.load("print(1)"))
+        self.assertEqual(self.entries(), [])
+
+    def test_evict(self):
+        cache = program_cache.ProgramCache(self.directory)
+        cache.get_program("print(1)")
+        size = os.path.getsize(os.path.join(self.directory, self.entries()[0]))
+        cache.max_bytes = 2 * size
+        for i in range(2, 6):
+            cache.get_program(f"print({i})")
+        self.assertEqual(len(self.entries()), 2)
+
+
+class TestCompiledCache(unittest.TestCase):
+    def compiled_cache(self, max_entries=16):
+        compiled = []
+
+        def compile(program):
+            compiled.append(program.key)
+            return len(compiled)
+
+        return program_cache.CompiledCache(compile, max_entries), compiled
+
+    def test_hit_and_miss(self):
+        cache, compiled = self.compiled_cache()
+        self.assertEqual(cache.get(ProgramNode([], key="a")), 1)
+        self.assertEqual(cache.get(ProgramNode([], key="a")), 1)
+        self.assertEqual(cache.get(ProgramNode([], key="b")), 2)
+        self.assertEqual(compiled, ["a", "b"])
+        self.assertEqual((cache.stats.hits, cache.stats.misses), (1, 2))
+
+    def test_no_key(self):
+        cache, compiled = self.compiled_cache()
+        cache.get(ProgramNode([]))
+        cache.get(ProgramNode([]))
+        self.assertEqual(compiled, [None, None])
+        self.assertEqual(len(cache), 0)
+
+    def test_evict(self):
+        cache, compiled = self.compiled_cache(max_entries=2)
+        for key in "abacb":
+            cache.get(ProgramNode([], key=key))
+        self.assertEqual(compiled, ["a", "b", "c", "b"])
+        self.assertEqual(len(cache), 2)
+
+    def run_program(self, code, backend):
+        fout = io.StringIO()
+        with self.assertRaises(NameError) as cm:
+            main(io.StringIO(code), fout, backend=backend)
+        self.assertEqual(fout.getvalue(), "42\n")
+        self.assertEqual(cm.exception.lineno, 3)
+
+    def test_main(self):
+        code = "a = 7\nprint(a * 6)\nprint(b)"
+        for backend, module in [("compiled", compiler), ("vm", vm)]:
+            with self.subTest(backend=backend):
+                module._programs.clear()
+                self.run_program(code, backend)
+                # A later run of the same program reuses its compiled code.
+                with mock.patch.object(
+                    module._programs, "compile",
+                    side_effect=AssertionError("compiled again"),
+                ):
+                    self.run_program(code, backend)
+
+    def test_main_optimize_with_env(self):
+        code = "a = 7\nb = a * 6"
+        for _ in range(2):
+            env = {}
+            main(io.StringIO(code), io.StringIO(), backend="compiled",
+                 optimize=True, env=env)
+            self.assertEqual(env, {"a": 7, "b": 42})
+        with mock.patch.object(compiler._programs, "compile",
+                               wraps=compiler.compile_program) as compile:
+            main(io.StringIO(code), io.StringIO(), backend="compiled",
+                 optimize=True, env={})
+        compile.assert_called_once()
+
+
+class TestOutputBuffer(unittest.TestCase):
+    def test(self):
+        fout = io.StringIO()
+        out = OutputBuffer(fout, buffer_size=4)
+        out.write("1\n")
+        self.assertEqual(fout.getvalue(), "")
+        out.write("22\n")
+        self.assertEqual(fout.getvalue(), "1\n22\n")
+        out.write("3\n")
+        out.flush()
+        self.assertEqual(fout.getvalue(), "1\n22\n3\n")
+
+    def test_flush_on_error(self):
+        fout = io.StringIO()
+        with self.assertRaises(NameError):
+            with OutputBuffer(fout) as out:
+                evaluate(ProgramNode([PrintNode(1), PrintNode(NameNode("x"))]),
+                         {}, out)
+        self.assertEqual(fout.getvalue(), "1\n")
+
+    def test_main(self):
+        code = "\n".join(f"print({i})" for i in range(100))
+        expected = "".join(f"{i}\n" for i in range(100))
+        for buffer_size in (0, 1, 16, 1 << 20):
+            with self.subTest(buffer_size=buffer_size):
+                fout = io.StringIO()
+                main(io.StringIO(code), fout, buffer_size=buffer_size)
+                self.assertEqual(fout.getvalue(), expected)
+
+
+class TestBatch(unittest.TestCase):
+    def test_run_program(self):
+        self.assertEqual(run_program("print(1)"), BatchResult("1\n"))
+        self.assertEqual(
+            run_program("print(1)\nprint(x)"),
+            BatchResult("1\n", NameError("Undefined variable: x"))
+        )
+
+    def test_run_batch(self):
+        sources = [spec["code"] for spec in PROGRAM_SPECS + ERROR_SPECS]
+        results = run_batch(sources, max_workers=2, chunksize=3)
+        self.assertEqual(len(results), len(sources))
+        for result, spec in zip(results, PROGRAM_SPECS + ERROR_SPECS):
+            with self.subTest(spec=spec):
+                self.assertEqual(result.output, spec["expected"])
+                if "exception" in spec:
+                    self.assertIsInstance(result.error, spec["exception"])
+                else:
+                    self.assertIsNone(result.error)
+
+    def test_isolated_env(self):
+        results = run_batch(["x = 1\nprint(x)", "print(x)"], max_workers=1)
+        self.assertIsInstance(results[1].error, NameError)
+
+    def test_options(self):
+        results = run_batch(["print(2*3)"], max_workers=1, backend="vm")
+        self.assertEqual(results, [BatchResult("6\n")])
+
+    def test_empty(self):
+        self.assertEqual(run_batch([]), [])
+
+
+class BytesWriter:
+    def __init__(self):
+        self.data = b""
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+
+def stream_reader(code):
+    reader = asyncio.StreamReader()
+    reader.feed_data(code.encode())
+    reader.feed_eof()
+    return reader
+
+
+class TestAsync(unittest.IsolatedAsyncioTestCase):
+    async def test_main_async(self):
+        for spec in PROGRAM_SPECS:
+            with self.subTest(spec=spec):
+                writer = BytesWriter()
+                await main_async(stream_reader(spec["code"]), writer,
+                                 yield_every=1)
+                self.assertEqual(writer.data.decode(), spec["expected"])
+
+    async def test_errors(self):
+        for spec in ERROR_SPECS:
+            with self.subTest(spec=spec):
+                writer = BytesWriter()
+                with self.assertRaises(spec["exception"]):
+                    await main_async(stream_reader(spec["code"]), writer)
+                self.assertEqual(writer.data.decode(), spec["expected"])
+
+    async def test_error_location(self):
+        specs = [
+            {"code": "x = 1\n\nprint(x + z)", "location": (3, 11)},
+            {"code": "x = 1\nprint(x / 0)", "location": (2, 9)},
+            {"code": "x = 1\nprint(x $ 1)", "location": (2, 9)},
+        ]
+        for spec in specs:
+            with self.subTest(spec=spec):
+                with self.assertRaises(Exception) as cm:
+                    await main_async(stream_reader(spec["code"]),
+                                     BytesWriter())
+                error = cm.exception
+                self.assertEqual((error.lineno, error.offset),
+                                 spec["location"])
+
+    async def test_evaluate_async(self):
+        node = ProgramNode([AssignNode("x", 2), PrintNode(NameNode("x"))])
+        env = {}
+        writer = BytesWriter()
+        await evaluate_async(node, env, writer)
+        self.assertEqual(writer.data, b"2\n")
+        self.assertEqual(env, {"x": 2})
+
+    async def test_interleaving(self):
+        finished = []
+
+        async def run(name, lines):
+            code = "\n".join(["print(1)"] * lines)
+            await main_async(stream_reader(code), BytesWriter(),
+                             yield_every=10)
+            finished.append(name)
+
+        await asyncio.gather(run("long", 1000), run("short", 10))
+        self.assertEqual(finished, ["short", "long"])
+
+
+@unittest.skipIf(vectorized.np is None, "NumPy is not installed")
+class TestVectorized(unittest.TestCase):
+    def test(self):
+        code = "\n".join([
+            "y = x / (x - 3)",
+            "print(y)",
+            "print()",
+            "print(10 / x + y * 2)",
+            "print(1 + 2)",
+        ])
+        envs = [{"x": x} for x in range(-3, 6)]
+        results = vectorized.run_vectorized(code, envs)
+        for env, result in zip(envs, results):
+            with self.subTest(env=env):
+                expected = run_program(
+                    f"x = 0 - {-env['x']}\n{code}" if env["x"] < 0
+                    else f"x = {env['x']}\n{code}"
+                )
+                self.assertEqual(result, expected)
+
+    def test_name_error(self):
+        results = vectorized.run_vectorized(
+            "print(1 / x)\nprint(y)", [{"x": 0}, {"x": 1}]
+        )
+        self.assertEqual(results, [
+            BatchResult("", ValueError("Division by zero")),
+            BatchResult("1\n", NameError("Undefined variable: y")),
+        ])
+
+    def test_large_values(self):
+        results = vectorized.run_vectorized(
+            "x = a*a*a*a*a*a*a*a\nprint(x)", [{"a": 1024}, {"a": 3}]
+        )
+        self.assertEqual(results, [
+            BatchResult(f"{2 ** 80}\n", None),
+            BatchResult(f"{3 ** 8}\n", None),
+        ])
+
+    def test_mismatched_envs(self):
+        with self.assertRaises(ValueError):
+            vectorized.stack_envs([{"x": 1}, {"y": 1}])
+
+
+class TestProfiler(unittest.TestCase):
+    def test_run(self):
+        profiler = Profiler()
+        code = "a = 1\n\nb = a * 2 + a\nprint(b / a)\nprint()"
+        for _ in range(2):
+            fout = io.StringIO()
+            profiler.run(code, fout)
+            self.assertEqual(fout.getvalue(), "3\n\n")
+
+        self.assertEqual(sorted(profiler.statements), [1, 3, 4, 5])
+        self.assertEqual(profiler.statements[3].count, 2)
+        self.assertEqual(profiler.statements[3].source, "b = a * 2 + a")
+        self.assertEqual(
+            profiler.operator_counts, {"*": 2, "+": 2, "/": 2}
+        )
+        self.assertEqual(profiler.reads, {"a": 6, "b": 2})
+        self.assertEqual(profiler.writes, {"a": 2, "b": 2})
+        report = profiler.report()
+        self.assertIn("b = a * 2 + a", report)
+
+    def test_evaluate(self):
+        profiler = Profiler()
+        node = ProgramNode([
+            AssignNode("x", 1),
+            PrintNode(BinOpNode(NameNode("x"), "-", NameNode("y"))),
+        ])
+        env = {}
+        fout = io.StringIO()
+        with self.assertRaises(NameError):
+            profiler.evaluate(node, env, fout)
+        self.assertEqual(env, {"x": 1})
+        self.assertEqual(profiler.statements[2].count, 1)
+        self.assertEqual(profiler.reads, {"x": 1, "y": 1})
+
+
+class TestBenchmarkCompare(unittest.TestCase):
+    def report(self, seconds, peak_bytes):
+        return {
+            "results": {
+                "case": {
+                    "lex": {"seconds": seconds, "peak_bytes": peak_bytes},
+                },
+            },
+        }
+
+    def test(self):
+        baseline = self.report(1.0, 1000)
+        specs = [
+            {"current": self.report(1.05, 1000), "expected": []},
+            {"current": self.report(0.5, 500), "expected": []},
+            {
+                "current": self.report(1.5, 1000),
+                "expected": [("case", "lex", ["time"])],
+            },
+            {
+                "current": self.report(1.0, 2000),
+                "expected": [("case", "lex", ["memory"])],
+            },
+        ]
+        for spec in specs:
+            with self.subTest(spec=spec):
+                regressions, table = compare_benchmarks(
+                    baseline, spec["current"], threshold=0.1
+                )
+                self.assertEqual(regressions, spec["expected"])
+                self.assertIn("case", table)
+
+
 class TestProgramNode(unittest.TestCase):
     def test(self):
         statements = [PrintNode(), PrintNode(1)]
@@ -588,30 +1613,662 @@ class TestNameNode(unittest.TestCase):
         self.assertIsInstance(repr(a), str)
 
 
+PROGRAM_SPECS = [
+    {"code": "print()", "expected": "\n"},
+    {"code": "print(123)", "expected": "123\n"},
+    {"code": "print(2+3)", "expected": "5\n"},
+    {"code": "print(2+3+5)", "expected": "10\n"},
+    {"code": "print(2+3-5)", "expected": "0\n"},
+    {"code": "print(3*4)", "expected": "12\n"},
+    {"code": "print(6/2)", "expected": "3\n"},
+    {"code": "print(2+3*4)", "expected": "14\n"},
+    {"code": "print((1+2)*3)", "expected": "9\n"},
+    {"code": "print()\nprint(1+2)", "expected": "\n3\n"},
+    {"code": "print()\n\nprint(1+2)", "expected": "\n3\n"},
+    {"code": "a=1\nprint(a+2)", "expected": "3\n"},
+]
+
+ERROR_SPECS = [
+    {"code": "print(1)\nprint(1/0)", "expected": "1\n",
+     "exception": ValueError},
+    {"code": "print(2)\nprint(x)", "expected": "2\n",
+     "exception": NameError},
+    {"code": "x = 7\nprint(x)\nx = x - 7\nprint(1/x)", "expected": "7\n",
+     "exception": ValueError},
+]
+
+
 class TestPython(unittest.TestCase):
     def test(self):
+        specs = PROGRAM_SPECS
+        for spec in specs:
+            with self.subTest(spec=spec):
+                fin = io.StringIO(spec["code"])
+                fout = io.StringIO()
+                main(fin, fout)
+
+                self.assertEqual(fout.getvalue(), spec["expected"])
+
+    def test_backends(self):
+        for backend in BACKENDS:
+            for spec in PROGRAM_SPECS:
+                with self.subTest(backend=backend, spec=spec):
+                    fin = io.StringIO(spec["code"])
+                    fout = io.StringIO()
+                    main(fin, fout, backend=backend)
+
+                    self.assertEqual(fout.getvalue(), spec["expected"])
+
+    def test_backend_errors(self):
+        for backend in BACKENDS:
+            for spec in ERROR_SPECS:
+                with self.subTest(backend=backend, spec=spec):
+                    fin = io.StringIO(spec["code"])
+                    fout = io.StringIO()
+                    with self.assertRaises(spec["exception"]):
+                        main(fin, fout, backend=backend)
+
+                    self.assertEqual(fout.getvalue(), spec["expected"])
+
+    def test_deeply_nested(self):
+        depth = 20000
+        specs = [
+            {
+                "code": "print(" + "(" * depth + "1" + "+1)" * depth + ")",
+                "expected": f"{depth + 1}\n",
+            },
+            {
+                "code": "x = 2\nprint(" + "+".join(["x"] * depth) + ")",
+                "expected": f"{2 * depth}\n",
+            },
+        ]
+        for backend in BACKENDS:
+            for optimize in (False, True):
+                for spec in specs:
+                    with self.subTest(backend=backend, optimize=optimize):
+                        fin = io.StringIO(spec["code"])
+                        fout = io.StringIO()
+                        main(fin, fout, backend=backend, optimize=optimize)
+
+                        self.assertEqual(fout.getvalue(), spec["expected"])
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            main(io.StringIO("print()"), io.StringIO(), backend="nope")
+
+    def test_stream(self):
         specs = [
-            {"code": "print()", "expected": "\n"},
-            {"code": "print(123)", "expected": "123\n"},
-            {"code": "print(2+3)", "expected": "5\n"},
-            {"code": "print(2+3+5)", "expected": "10\n"},
-            {"code": "print(2+3-5)", "expected": "0\n"},
-            {"code": "print(3*4)", "expected": "12\n"},
-            {"code": "print(6/2)", "expected": "3\n"},
-            {"code": "print(2+3*4)", "expected": "14\n"},
-            {"code": "print((1+2)*3)", "expected": "9\n"},
             {"code": "print()\nprint(1+2)", "expected": "\n3\n"},
             {"code": "print()\n\nprint(1+2)", "expected": "\n3\n"},
-            {"code": "a=1\nprint(a+2)", "expected": "3\n"},
+            {"code": "a=1\nprint(a+2)\n", "expected": "3\n"},
         ]
         for spec in specs:
             with self.subTest(spec=spec):
                 fin = io.StringIO(spec["code"])
                 fout = io.StringIO()
-                main(fin, fout)
+                main(fin, fout, stream=True)
 
                 self.assertEqual(fout.getvalue(), spec["expected"])
 
+    def test_stream_line_breaks(self):
+        codes = [
+            "x = 1\x0cprint(x)\n",
+            "x = 1\x85\u2028y = x + 1\x1eprint(y)\r\nprint(x)",
+            "x = 1\x0c\x0cprint(y)\n",
+        ]
+        for code in codes:
+            with self.subTest(code=code):
+                outputs = []
+                for stream in (False, True):
+                    fout = io.StringIO()
+                    try:
+                        main(io.StringIO(code), fout, stream=stream)
+                    except NameError as error:
+                        fout.write(f"{error.lineno}:{error.offset}")
+                    outputs.append(fout.getvalue())
+                self.assertEqual(outputs[1], outputs[0])
+
+    def test_stream_output_before_end_of_input(self):
+        fout = io.StringIO()
+
+        def lines():
+            yield "print(1)\n"
+            self.assertEqual(fout.getvalue(), "1\n")
+            yield "print(2)\n"
+
+        main(lines(), fout, stream=True)
+        self.assertEqual(fout.getvalue(), "1\n2\n")
+
+
+class TestSourceMap(unittest.TestCase):
+    def test(self):
+        source_map = SourceMap.from_code("a = 1\r\nprint(a)\n\nb = 2")
+        self.assertEqual(list(source_map.line_starts), [0, 7, 16, 17])
+        self.assertEqual(source_map.location(0), (1, 1))
+        self.assertEqual(source_map.location(13), (2, 7))
+        self.assertEqual(source_map.location(21), (4, 5))
+        self.assertEqual(source_map.line_text(2), "print(a)")
+        self.assertEqual(source_map.line_text(4), "b = 2")
+
+    def test_line_source_map(self):
+        source_map = LineSourceMap()
+        lines = ["a = 1\r\n", "\n", "print(a)\n"]
+        for _ in tokenize_lines(lines, source_map):
+            pass
+        self.assertEqual(source_map.location(13), (3, 6))
+        self.assertEqual(source_map.line_text(3), "print(a)")
+        # Earlier lines are not kept.
+        self.assertIsNone(source_map.location(2))
+        self.assertIsNone(source_map.line_text(1))
+
+    def test_positions(self):
+        program = parse_program(tokenize_program("x = 1\nprint(x * (2 - y))"))
+        assign, print_ = program.statements
+        self.assertEqual(assign.pos, 0)
+        self.assertEqual(print_.pos, 6)
+        self.assertEqual(print_.value.pos, 14)
+        self.assertEqual(print_.value.right.pos, 19)
+        self.assertEqual(print_.value.right.right.pos, 21)
+
+    def test_syntax_errors(self):
+        specs = [
+            {"code": "x = 1\ny = 2 $", "line": 2, "offset": 7},
+            {"code": "x = 1\n\nprint(1 +)", "line": 3, "offset": 10},
+            {"code": "x = (1 + 2\nprint()", "line": 1, "offset": 11},
+            {"code": "x = 1\n  print(x) 3", "line": 2, "offset": 3},
+        ]
+        for spec in specs:
+            for stream in (False, True):
+                with self.subTest(spec=spec, stream=stream):
+                    with self.assertRaises(SyntaxError) as cm:
+                        main(io.StringIO(spec["code"]), io.StringIO(),
+                             stream=stream)
+                    self.assertEqual(cm.exception.lineno, spec["line"])
+                    self.assertEqual(cm.exception.offset, spec["offset"])
+                    line = spec["code"].splitlines()[spec["line"] - 1]
+                    self.assertEqual(cm.exception.text, line)
+
+    def test_runtime_errors(self):
+        # The tree-walker points at the failing expression; the compiled
+        # flat and vm backends at the start of the failing statement.
+        specs = [
+            {"code": "x = 1\nprint(x + z)", "error": NameError,
+             "tree": (2, 11), "statement": (2, 1)},
+            {"code": "x = 1\n\ny = 3 / (x - 1)", "error": ValueError,
+             "tree": (3, 7), "statement": (3, 1)},
+        ]
+        for spec in specs:
+            for backend in ("tree", "compiled", "flat", "vm"):
+                for stream in (False, True):
+                    location = spec[
+                        "tree" if backend == "tree" else "statement"
+                    ]
+                    with self.subTest(spec=spec, backend=backend,
+                                      stream=stream):
+                        with self.assertRaises(spec["error"]) as cm:
+                            main(io.StringIO(spec["code"]), io.StringIO(),
+                                 backend=backend, stream=stream)
+                        error = cm.exception
+                        self.assertEqual((error.lineno, error.offset),
+                                         location)
+                        self.assertEqual(
+                            error.__notes__,
+                            ["at line %d, column %d" % location],
+                        )
+
+    def test_optimized_and_cached(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = program_cache.ProgramCache(directory)
+            for _ in range(2):
+                with self.assertRaises(NameError) as cm:
+                    main(io.StringIO("x = 1\nprint(x * 0 + z)"),
+                         io.StringIO(), cache=cache, optimize=True)
+                self.assertEqual(cm.exception.lineno, 2)
+
+
+class TestMappedInput(unittest.TestCase):
+    def run_file(self, code, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "program.py")
+            with open(path, "wb") as f:
+                f.write(code.encode())
+            fout = io.StringIO()
+            with open(path, "rb") as fin:
+                try:
+                    main(fin, fout, mapped=True, **options)
+                finally:
+                    self.output = fout.getvalue()
+
+    def test(self):
+        for backend in BACKENDS:
+            for spec in PROGRAM_SPECS + [{"code": "", "expected": ""}]:
+                with self.subTest(backend=backend, spec=spec):
+                    self.run_file(spec["code"], backend=backend)
+                    self.assertEqual(self.output, spec["expected"])
+
+    def test_errors(self):
+        for spec in ERROR_SPECS:
+            with self.subTest(spec=spec):
+                with self.assertRaises(spec["exception"]):
+                    self.run_file(spec["code"])
+                self.assertEqual(self.output, spec["expected"])
+
+    def test_error_before_end(self):
+        # The mapping is closed while the lexer is still part way through.
+        specs = [
+            {"code": "print(1)\nprint(x)\nprint(2)\n",
+             "exception": NameError},
+            {"code": "print(1)\nprint(1/0)\nprint(2)\n",
+             "exception": ValueError},
+        ]
+        for optimize in (False, True):
+            for spec in specs:
+                with self.subTest(optimize=optimize, spec=spec):
+                    with self.assertRaises(spec["exception"]) as cm:
+                        self.run_file(spec["code"], optimize=optimize)
+                    self.assertEqual(cm.exception.lineno, 2)
+                    self.assertEqual(self.output, "1\n")
+
+    def test_location(self):
+        with self.assertRaises(NameError) as cm:
+            self.run_file("\u00e9 = 1\n\nprint(\u00e9 + z)")
+        self.assertEqual((cm.exception.lineno, cm.exception.offset), (3, 11))
+
+        with self.assertRaises(SyntaxError) as cm:
+            self.run_file("x = 1\r\nprint(\u00e9 +)")
+        self.assertEqual((cm.exception.lineno, cm.exception.offset), (2, 10))
+        self.assertEqual(cm.exception.text, "print(\u00e9 +)")
+
+    def test_cache_rejected(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = program_cache.ProgramCache(directory)
+            with self.assertRaises(ValueError):
+                main(io.BytesIO(b"print()"), io.StringIO(), mapped=True,
+                     cache=cache)
+
+    def test_in_memory(self):
+        # Streams without a file descriptor are read instead of mapped.
+        for fin in (io.StringIO("x = 1\nprint(x + 1)"),
+                    io.BytesIO(b"x = 1\nprint(x + 1)")):
+            with self.subTest(fin=fin):
+                fout = io.StringIO()
+                main(fin, fout, mapped=True)
+                self.assertEqual(fout.getvalue(), "2\n")
+        with self.assertRaises(NameError) as cm:
+            main(io.StringIO("x = 1\nprint(y)"), io.StringIO(), mapped=True)
+        self.assertEqual(cm.exception.lineno, 2)
+
+    def test_empty_file(self):
+        for backend in ("tree", "vm"):
+            with self.subTest(backend=backend):
+                self.run_file("", backend=backend)
+                self.assertEqual(self.output, "")
+
+
+class TestIncrementalSession(unittest.TestCase):
+    def run_session(self, session, code):
+        fout = io.StringIO()
+        env = session.run(code, fout)
+        expected_out = io.StringIO()
+        expected_env = {}
+        evaluate(parse_program(tokenize_program(code)), expected_env,
+                 expected_out)
+        self.assertEqual(fout.getvalue(), expected_out.getvalue())
+        self.assertEqual(env, expected_env)
+        return session.parsed, session.executed, session.reused
+
+    def test(self):
+        session = IncrementalSession()
+        lines = ["a = 1", "b = 2", "print(a)", "c = b * 3", "print(c + a)",
+                 "d = 7", "print(d)"]
+        code = "\n".join(lines)
+        self.assertEqual(self.run_session(session, code), (7, 7, 0))
+        self.assertEqual(self.run_session(session, code), (0, 0, 7))
+
+        # Only statements reading b, directly or through c, run again.
+        lines[1] = "b = 5"
+        code = "\n".join(lines)
+        self.assertEqual(self.run_session(session, code), (1, 3, 4))
+
+        # An edit that leaves the value unchanged stops propagating.
+        lines[1] = "b = 10 / 2"
+        code = "\n".join(lines)
+        self.assertEqual(self.run_session(session, code), (1, 1, 6))
+
+        lines.insert(3, "")
+        lines.insert(4, "a = 2")
+        code = "\n".join(lines)
+        self.assertEqual(self.run_session(session, code), (2, 2, 6))
+
+        del lines[2]
+        code = "\n".join(lines)
+        self.assertEqual(self.run_session(session, code), (0, 0, 7))
+
+    def test_errors(self):
+        session = IncrementalSession()
+        with self.assertRaises(NameError) as cm:
+            self.run_session(session, "x = 1\n\nprint(x + y)\nprint(x)")
+        self.assertEqual((cm.exception.lineno, cm.exception.offset), (3, 11))
+
+        with self.assertRaises(SyntaxError) as cm:
+            session.run("x = 1\ny = (x", io.StringIO())
+        self.assertEqual((cm.exception.lineno, cm.exception.offset), (2, 7))
+
+        # After a failed run, only the statements before the error are
+        # reused.
+        code = "x = 1\n\nprint(x + 1)\nprint(x)"
+        self.assertEqual(self.run_session(session, code), (1, 2, 1))
+
+
+class TestSession(unittest.TestCase):
+    def test_run(self):
+        session = server.Session()
+        self.assertEqual(session.run("x = 2\nprint(x * 3)"), ("6\n", None))
+        self.assertEqual(session.run("x = x + 1\nprint(x)"), ("3\n", None))
+
+        output, error = session.run("print(x)\nprint(y)")
+        self.assertEqual(output, "3\n")
+        self.assertIsInstance(error, NameError)
+        self.assertEqual((session.stats.programs, session.stats.errors),
+                         (3, 1))
+
+        session.reset()
+        output, error = session.run("print(x)")
+        self.assertIsInstance(error, NameError)
+
+    def test_handle(self):
+        session = server.Session(backend="vm")
+        specs = [
+            ('{"id": 1, "code": "a = 4\\nprint(a / 2)"}',
+             {"id": 1, "output": "2\n", "error": None}),
+            ('{"id": 2, "code": "print(a)\\nprint(a + (1"}',
+             {"id": 2, "output": "", "error": {
+                 "type": "SyntaxError", "message": "Failed to parse",
+                 "line": 2, "column": 1}}),
+            ('{"id": 3, "op": "reset"}', {"id": 3}),
+            ('{"id": 4}', {"id": 4, "error": {
+                "type": "ProtocolError",
+                "message": "A run request needs a code string"}}),
+            ('[]', {"id": None, "error": {
+                "type": "ProtocolError",
+                "message": "A request must be an object"}}),
+            ('{"id": 5, "op": "eval"}', {"id": 5, "error": {
+                "type": "ProtocolError", "message": "Unknown op: eval"}}),
+        ]
+        for request, expected in specs:
+            with self.subTest(request=request):
+                self.assertEqual(session.handle(request), expected)
+
+        stats = session.handle('{"id": 6, "op": "stats"}')["stats"]
+        self.assertEqual(stats["requests"], 7)
+        self.assertEqual(stats["programs"], 2)
+        self.assertEqual(stats["errors"], 4)
+        self.assertEqual(stats["variables"], 0)
+
+    def test_serve(self):
+        requests = [
+            {"id": 1, "code": "x = 1"},
+            {"id": 2, "code": "print(x + 1)"},
+        ]
+        fin = io.StringIO("".join(json.dumps(r) + "\n" for r in requests))
+        fout = io.StringIO()
+        server.serve(fin, fout)
+        self.assertEqual(
+            [json.loads(line) for line in fout.getvalue().splitlines()],
+            [{"id": 1, "output": "", "error": None},
+             {"id": 2, "output": "2\n", "error": None}],
+        )
+
+
+@unittest.skipUnless(hasattr(socket, "AF_UNIX"), "needs Unix sockets")
+class TestSessionServer(unittest.IsolatedAsyncioTestCase):
+    async def test_pipelining(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "session.sock")
+            task = asyncio.create_task(server.serve_unix(path))
+            while not os.path.exists(path):
+                await asyncio.sleep(0.01)
+
+            reader, writer = await asyncio.open_unix_connection(path)
+            count = 50
+            writer.write(b'{"id": 0, "code": "x = 0"}\n')
+            for i in range(1, count):
+                request = {"id": i, "code": "x = x + 1\nprint(x)"}
+                writer.write(json.dumps(request).encode() + b"\n")
+            await writer.drain()
+
+            responses = [json.loads(await reader.readline())
+                         for _ in range(count)]
+            self.assertEqual([r["id"] for r in responses], list(range(count)))
+            self.assertEqual(responses[-1]["output"], f"{count - 1}\n")
+
+            # A second connection starts with its own environment.
+            reader2, writer2 = await asyncio.open_unix_connection(path)
+            writer2.write(b'{"id": 1, "code": "print(x)"}\n')
+            response = json.loads(await reader2.readline())
+            self.assertEqual(response["error"]["type"], "NameError")
+
+            for w in (writer, writer2):
+                w.close()
+                await w.wait_closed()
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+    async def test_runs_off_event_loop(self):
+        threads = []
+        handle = server.Session.handle
+
+        def record(session, line):
+            threads.append(threading.get_ident())
+            return handle(session, line)
+
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.object(server.Session, "handle", record):
+            path = os.path.join(directory, "session.sock")
+            task = asyncio.create_task(server.serve_unix(path))
+            while not os.path.exists(path):
+                await asyncio.sleep(0.01)
+
+            reader, writer = await asyncio.open_unix_connection(path)
+            writer.write(b'{"id": 1, "code": "print(1)"}\n')
+            response = json.loads(await reader.readline())
+            self.assertEqual(response["output"], "1\n")
+            self.assertEqual(len(threads), 1)
+            self.assertNotEqual(threads[0], threading.get_ident())
+
+            writer.close()
+            await writer.wait_closed()
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+
+class FakeClock:
+    def __init__(self, step):
+        self.now = 0.0
+        self.step = step
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+
+class TestBudget(unittest.TestCase):
+    def test_limits(self):
+        square = "x = 3\n" + "x = x * x\n" * 30
+        specs = [
+            {"budget": Budget(max_statements=3),
+             "code": "print(1)\nprint(2)\nprint(3)\nprint(4)",
+             "limit": "statements", "line": 4, "expected": "1\n2\n3\n"},
+            {"budget": Budget(max_variables=2),
+             "code": "a = 1\nb = 2\nprint(a)\na = 3\nc = 4",
+             "limit": "variables", "line": 5, "expected": "1\n"},
+            {"budget": Budget(max_bits=64), "code": square,
+             "limit": "bits", "line": 7, "expected": ""},
+            {"budget": Budget(max_time=10, clock=FakeClock(1)),
+             "code": "print(1)\n" * 20,
+             "limit": "time", "line": 11, "expected": "1\n" * 10},
+        ]
+        for spec in specs:
+            with self.subTest(limit=spec["limit"]):
+                fout = io.StringIO()
+                with self.assertRaises(BudgetExceeded) as cm:
+                    main(io.StringIO(spec["code"]), fout,
+                         budget=spec["budget"])
+                error = cm.exception
+                self.assertEqual(error.limit, spec["limit"])
+                self.assertEqual(error.lineno, spec["line"])
+                self.assertEqual(fout.getvalue(), spec["expected"])
+
+    def test_oversized_product_not_computed(self):
+        budget = Budget(max_bits=1000)
+        big = 2 ** 900
+        multiply = budget.operators()["*"]
+        with self.assertRaises(BudgetExceeded):
+            multiply(big, big)
+        self.assertEqual(budget.largest_bits, 0)
+        self.assertEqual(multiply(0, big), 0)
+
+    def test_time_within_statement(self):
+        budget = Budget(max_time=100, clock=FakeClock(1))
+        code = "print(" + "*".join(["1"] * 200_000) + ")"
+        with self.assertRaises(BudgetExceeded) as cm:
+            main(io.StringIO(code), io.StringIO(), budget=budget)
+        self.assertEqual(cm.exception.limit, "time")
+        self.assertEqual(cm.exception.usage["statements"], 1)
+
+    def test_usage(self):
+        budget = Budget(max_statements=10, max_bits=100, max_variables=5)
+        fout = io.StringIO()
+        main(io.StringIO("a = 2 * 3\nb = a * a + 1\nprint(b + 1)"), fout,
+             budget=budget)
+        self.assertEqual(fout.getvalue(), "38\n")
+        usage = budget.usage()
+        self.assertEqual(
+            (usage["statements"], usage["largest_bits"], usage["variables"]),
+            (3, 6, 2),
+        )
+
+    def test_additions_checked_per_statement(self):
+        budget = Budget(max_bits=64)
+        code = "x = 1\n" + "x = x + x\n" * 70
+        with self.assertRaises(BudgetExceeded) as cm:
+            main(io.StringIO(code), io.StringIO(), budget=budget)
+        self.assertEqual((cm.exception.limit, cm.exception.lineno),
+                         ("bits", 65))
+
+    def test_batch(self):
+        sources = ["print(1)\nprint(2)", "print(1)\nprint(2)\nprint(3)"]
+        results = run_batch(sources, max_workers=1,
+                            budget=Budget(max_statements=2))
+        self.assertEqual(results[0], BatchResult("1\n2\n"))
+        self.assertEqual(results[1].output, "1\n2\n")
+        error = results[1].error
+        self.assertIsInstance(error, BudgetExceeded)
+        self.assertEqual((error.limit, error.lineno), ("statements", 3))
+        self.assertEqual(error.usage["statements"], 3)
+
+    def test_other_backends_rejected(self):
+        with self.assertRaises(ValueError):
+            main(io.StringIO("print(1)"), io.StringIO(), backend="vm",
+                 budget=Budget(max_statements=1))
+
+
+class TestParallelParse(unittest.TestCase):
+    code = "a = 1\r\nb = a * (2 + 3)\n\nprint(b)\nprint()\nc = b / a - 4\n"
+
+    def test_split_chunks(self):
+        for chunks in range(1, 8):
+            with self.subTest(chunks=chunks):
+                pieces = parallel.split_chunks(self.code, chunks)
+                self.assertEqual("".join(t for _, t in pieces), self.code)
+                for offset, text in pieces:
+                    self.assertEqual(self.code[offset:].find(text), 0)
+                    self.assertNotEqual(text[-1:], "\r")
+        self.assertEqual(parallel.split_chunks("", 4), [(0, "")])
+
+    def test_parse_parallel(self):
+        expected = parse_program(tokenize_program(self.code)).statements
+        with ProcessPoolExecutor(2) as executor:
+            for chunks in [1, 3, 10]:
+                with self.subTest(chunks=chunks):
+                    statements = parallel.parse_parallel(
+                        self.code, executor, chunks=chunks
+                    ).statements
+                    self.assertEqual(statements, expected)
+                    self.assertEqual([s.pos for s in statements],
+                                     [s.pos for s in expected])
+
+            with self.assertRaises(SyntaxError) as cm:
+                parallel.parse_parallel(self.code + "x = $", executor,
+                                        chunks=4)
+            self.assertEqual(cm.exception.pos, len(self.code) + 4)
+
+    def test_main(self):
+        fout = io.StringIO()
+        main(io.StringIO(self.code), fout, workers=2)
+        self.assertEqual(fout.getvalue(), "5\n\n")
+        with self.assertRaises(SyntaxError) as cm:
+            main(io.StringIO(self.code + "x = $"), io.StringIO(), workers=2)
+        self.assertEqual(cm.exception.lineno, 7)
+        with self.assertRaises(ValueError):
+            main(io.StringIO(self.code), io.StringIO(), stream=True,
+                 workers=2)
+
+
+class TestScheduler(unittest.TestCase):
+    def test_dependencies(self):
+        program = parse_program(tokenize_program(
+            "a = 1\nb = a + c\na = b * a\nprint(a + b)\nprint()"
+        ))
+        self.assertEqual(scheduler.dependencies(program.statements), [
+            {}, {"a": 0, "c": None}, {"a": 0, "b": 1}, {"a": 2, "b": 1}, {},
+        ])
+
+    def run_program(self, code, executor, env=None):
+        fout = io.StringIO()
+        env = {} if env is None else env
+        program = parse_program(tokenize_program(code))
+        try:
+            scheduler.evaluate_parallel(program, env, fout, executor,
+                                        inline_bits=0)
+        finally:
+            self.output = fout.getvalue()
+
+    def test_workers(self):
+        # With inline_bits=0 every statement reading a name is sent to a
+        # worker.
+        with ProcessPoolExecutor(2) as executor:
+            for spec in PROGRAM_SPECS:
+                with self.subTest(spec=spec):
+                    self.run_program(spec["code"], executor)
+                    self.assertEqual(self.output, spec["expected"])
+
+            for spec in ERROR_SPECS:
+                with self.subTest(spec=spec):
+                    with self.assertRaises(spec["exception"]):
+                        self.run_program(spec["code"], executor)
+                    self.assertEqual(self.output, spec["expected"])
+
+            env = {"c": 5}
+            self.run_program("a = c * 2\nc = a + 1\nb = c * c\nprint(b)",
+                             executor, env)
+            self.assertEqual(env, {"a": 10, "b": 121, "c": 11})
+            self.assertEqual(self.output, "121\n")
+
+    def test_first_error(self):
+        # Later statements may finish first, but the first failing
+        # statement in program order decides the error and the output.
+        code = "a = 1\nprint(a)\nb = 1 / 0\nprint(x)\nprint(2)\na = 5"
+        env = {}
+        with ProcessPoolExecutor(2) as executor:
+            with self.assertRaises(ValueError) as cm:
+                self.run_program(code, executor, env)
+        self.assertEqual(cm.exception.pos, code.index("1 / 0") + 2)
+        self.assertEqual(self.output, "1\n")
+        self.assertEqual(env, {"a": 1})
+
 
 class TestToken(unittest.TestCase):
     def test(self):